@@ -0,0 +1,226 @@
+"""Time loading a deep chain of extended configuration files.
+
+Usage: python benchmarks/load_extends.py [files] [sections] [options]
+
+Writes a chain of configuration files (40 by default), each extending the
+next, with the given numbers of sections (40) of options (26), some of
+which extend the values of the next file with +=.  Then reports the best
+time of several loads, and the peak memory of one, measured with
+tracemalloc, of:
+
+- the representation merges used before: section keys that are deep-copied,
+  with their history, at each merge,
+
+- the current one: section keys with slots, shared between the
+  configurations being merged and copied only when they change, keeping
+  their full history, as for the annotate command,
+
+- the same, keeping only the history since values were last set, as for
+  other commands.
+
+The results are checked to be the same.  The representation used
+before is only timed once, as it takes a while.
+"""
+import contextlib
+import copy
+import os
+import shutil
+import sys
+import tempfile
+import time
+import tracemalloc
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..', 'src'))
+
+import zc.buildout.buildout
+from zc.buildout.buildout import HistoryItem
+
+
+class OldSectionKey(object):
+    """SectionKey of zc.buildout 5.1, without the printing methods."""
+
+    def __init__(self, value, source):
+        self.history = []
+        self.value = value
+        self.addToHistory("SET", value, source)
+
+    @property
+    def source(self):
+        return self.history[-1].source
+
+    def overrideValue(self, sectionkey):
+        self.value = sectionkey.value
+        if sectionkey.history[-1].operation not in ['ADD', 'REMOVE']:
+            self.addToHistory("OVERRIDE", sectionkey.value, sectionkey.source)
+        else:
+            self.history = copy.deepcopy(sectionkey.history)
+
+    def addToValue(self, added, source):
+        subvalues = self.value.split('\n') + added.split('\n')
+        self.value = "\n".join(subvalues)
+        self.addToHistory("ADD", added, source)
+
+    def removeFromValue(self, removed, source):
+        subvalues = [
+            v
+            for v in self.value.split('\n')
+            if v not in removed.split('\n')
+        ]
+        self.value = "\n".join(subvalues)
+        self.addToHistory("REMOVE", removed, source)
+
+    def addToHistory(self, operation, value, source):
+        item = HistoryItem(operation, value, source)
+        self.history.append(item)
+
+
+def old_annotate_section(section, source, full_history=True):
+    for key in section:
+        section[key] = OldSectionKey(section[key], source)
+    return section
+
+
+def old_update_section(in1, s2):
+    """_update_section of zc.buildout 5.1."""
+    s1 = copy.deepcopy(in1)
+    s2 = copy.deepcopy(s2)
+    for k, v in sorted(s2.items(), key=lambda x: (x[0].rstrip(' +'), x[0][-1])):
+        if k.endswith('+'):
+            key = k.rstrip(' +')
+            implicit_value = OldSectionKey("", "IMPLICIT_VALUE")
+            section_key = s2.get(key, s1.get(key, implicit_value))
+            section_key = copy.deepcopy(section_key)
+            section_key.addToValue(v.value, v.source)
+            s2[key] = section_key
+            del s2[k]
+        elif k.endswith('-'):
+            key = k.rstrip(' -')
+            implicit_value = OldSectionKey("", "IMPLICIT_VALUE")
+            section_key = s2.get(key, s1.get(key, implicit_value))
+            section_key = copy.deepcopy(section_key)
+            section_key.removeFromValue(v.value, v.source)
+            s2[key] = section_key
+            del s2[k]
+
+    for key, v2 in s2.items():
+        if key in s1:
+            s1[key].overrideValue(v2)
+        else:
+            s1[key] = copy.deepcopy(v2)
+    return s1
+
+
+def old_update(in1, d2):
+    """_update of zc.buildout 5.1."""
+    d1 = copy.deepcopy(in1)
+    for section in d2:
+        if section in d1:
+            d1[section] = old_update_section(d1[section], d2[section])
+        elif '<' not in d2[section].keys():
+            temp = copy.deepcopy(d2[section])
+            for k, v in sorted(temp.items(), key=lambda item: item[0]):
+                if k[-1] == '+' and k[:-2] not in temp:
+                    temp[k[:-2]] = temp[k]
+                    del temp[k]
+                elif k[-1] == '-' and k[:-2] not in temp:
+                    temp[k[:-2]] = temp[k]
+                    temp[k[:-2]].removeFromValue(
+                        temp[k[:-2]].value, "IMPLICIT_VALUE"
+                        )
+                    del temp[k]
+            d1[section] = old_update_section({}, temp)
+        else:
+            d1[section] = copy.deepcopy(d2[section])
+    return d1
+
+
+@contextlib.contextmanager
+def old_representation():
+    module = zc.buildout.buildout
+    saved = (module._annotate_section, module._update_section,
+             module._update)
+    module._annotate_section = old_annotate_section
+    module._update_section = old_update_section
+    module._update = old_update
+    try:
+        yield
+    finally:
+        (module._annotate_section, module._update_section,
+         module._update) = saved
+
+
+def write_chain(directory, files, sections, options):
+    for i in range(files):
+        lines = ['[buildout]']
+        if i + 1 < files:
+            lines.append('extends = file%d.cfg' % (i + 1))
+        for j in range(sections):
+            lines.append('[section-%d]' % j)
+            for k in range(options):
+                if k % 5 == 0 and i + 1 < files:
+                    lines.append('option-%d += value-%d-%d-%d' % (k, i, j, k))
+                else:
+                    lines.append('option-%d = value-%d-%d-%d' % (k, i, j, k))
+        with open(os.path.join(directory, 'file%d.cfg' % i), 'w') as f:
+            f.write('\n'.join(lines) + '\n')
+
+
+def load(directory, full_history):
+    result, _ = zc.buildout.buildout._open(
+        directory, 'file0.cfg', [], {}, {}, set(), {},
+        full_history=full_history)
+    return result
+
+
+def history(result):
+    return dict(
+        ((section, key), [(item.operation, item.value, item.source)
+                          for item in sectionkey.history])
+        for (section, options) in result.items()
+        for (key, sectionkey) in options.items())
+
+
+def measure(directory, full_history, runs=3):
+    times = []
+    for _ in range(runs):
+        start = time.perf_counter()
+        result = load(directory, full_history)
+        times.append(time.perf_counter() - start)
+    tracemalloc.start()
+    load(directory, full_history)
+    peak = tracemalloc.get_traced_memory()[1]
+    tracemalloc.stop()
+    return min(times), peak, result
+
+
+def main(args):
+    files, sections, options = [
+        int(arg) for arg in (args + ['40', '40', '26'][len(args):])]
+    directory = tempfile.mkdtemp()
+    try:
+        write_chain(directory, files, sections, options)
+        print('%d files of %d sections of %d options' % (
+            files, sections, options))
+        with old_representation():
+            old_time, old_peak, old = measure(directory, True, runs=1)
+        full_time, full_peak, full = measure(directory, True)
+        new_time, new_peak, new = measure(directory, False)
+    finally:
+        shutil.rmtree(directory)
+
+    old_values = zc.buildout.buildout._unannotate(old)
+    assert zc.buildout.buildout._unannotate(full) == old_values
+    assert zc.buildout.buildout._unannotate(new) == old_values
+    assert history(full) == history(old), "The histories aren't the same."
+
+    for name, elapsed, peak in [
+            ('deep-copied keys', old_time, old_peak),
+            ('shared keys, full history', full_time, full_peak),
+            ('shared keys', new_time, new_peak),
+            ]:
+        print('  %-26s %7.3fs %7.1fMB' % (
+            name + ':', elapsed, peak / 1024 / 1024))
+
+
+if __name__ == '__main__':
+    main(sys.argv[1:])
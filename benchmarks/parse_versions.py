@@ -0,0 +1,90 @@
+"""Time the configuration parser on large configuration files.
+
+Usage: python benchmarks/parse_versions.py [size-in-megabytes] [path]
+
+Reports the best time of several runs of the current parser and of the
+readline-based parser it replaced, after checking that both give the same
+result, on:
+
+- a versions section of about the given size (3.5MB by default), with
+  mostly one-line options,
+
+- an option with a long multi-line value, of the same size up to 1MB, as
+  the readline-based parser takes quadratic time on these,
+
+- or only on the configuration file at path, if one is given.
+"""
+from io import StringIO
+
+import os
+import sys
+import time
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..', 'src'))
+
+import zc.buildout.configparser
+from zc.buildout.tests.test_configparser import readline_parse
+
+
+def generate_versions(size):
+    lines = ['[versions]']
+    length = 0
+    number = 0
+    while length < size:
+        line = 'package-%d = %d.%d.%d' % (
+            number, number % 7, number % 13, number % 101)
+        lines.append(line)
+        length += len(line) + 1
+        number += 1
+        if number % 50 == 0:
+            # Some comments and multi-line values too.
+            lines.append('# section %d' % number)
+            lines.append('extra-%d =' % number)
+            lines.extend('    requirement-%d' % i for i in range(10))
+    return '\n'.join(lines) + '\n'
+
+
+def generate_long_value(size):
+    lines = ['[buildout]', 'eggs =']
+    length = 0
+    number = 0
+    while length < size:
+        line = '    package-%d' % number
+        lines.append(line)
+        length += len(line) + 1
+        number += 1
+    return '\n'.join(lines) + '\n'
+
+
+def best(parse, text, runs=5):
+    times = []
+    for _ in range(runs):
+        start = time.perf_counter()
+        result = parse(StringIO(text), 'versions.cfg')
+        times.append(time.perf_counter() - start)
+    return min(times), result
+
+
+def compare(name, text):
+    new_time, new = best(zc.buildout.configparser.parse, text)
+    old_time, old = best(readline_parse, text)
+    assert new == old, "The parsers don't give the same result."
+    print('%s: %.1fMB, %d lines' % (
+        name, len(text) / 1024 / 1024, text.count('\n')))
+    print('  readline parser: %.3fs' % old_time)
+    print('  current parser:  %.3fs' % new_time)
+
+
+def main(args):
+    if len(args) > 1:
+        with open(args[1]) as f:
+            compare(args[1], f.read())
+        return
+
+    size = int(float(args[0] if args else 3.5) * 1024 * 1024)
+    compare('versions', generate_versions(size))
+    compare('long value', generate_long_value(min(size, 1024 * 1024)))
+
+
+if __name__ == '__main__':
+    main(sys.argv[1:])
@@ -15,6 +15,7 @@
 """
 
 from collections.abc import MutableMapping as DictMixin
+from functools import lru_cache
 from functools import partial
 from hashlib import md5 as md5_original
 from packaging import utils as packaging_utils
@@ -23,13 +24,19 @@ from zc.buildout.rmtree import rmtree
 import zc.buildout.easy_install
 import zc.buildout.utils
 import zc.buildout.configparser
+import concurrent.futures
+import contextlib
+import cProfile
 import copy
 import datetime
 import distutils.errors
+import fnmatch
 import glob
+import hashlib
 import importlib
 import inspect
 import itertools
+import json
 import logging
 import os
 import pkg_resources
@@ -38,6 +45,8 @@ import shutil
 import subprocess
 import sys
 import tempfile
+import threading
+import time
 import zc.buildout
 import zc.buildout.download
 
@@ -86,18 +95,39 @@ class MissingSection(zc.buildout.UserError, KeyError):
         return "The referenced section, %r, was not defined." % self.args[0]
 
 
-def _annotate_section(section, source):
+def _annotate_section(section, source, full_history=True):
     for key in section:
-        section[key] = SectionKey(section[key], source)
+        section[key] = SectionKey(section[key], source, full_history)
     return section
 
 
 class SectionKey(object):
-    def __init__(self, value, source):
+    """An option value, with the history of how it got its value.
+
+    Section keys are shared between the configurations being merged, so
+    use copy() to get one that can be changed.  History items are never
+    changed, so they are shared between copies.
+
+    Unless full_history is true, only the history since the value was
+    last set is kept.  That's all that's needed, except for verbose
+    annotation.  Copies keep the full_history setting of the original.
+    """
+
+    __slots__ = 'value', 'history', 'full_history'
+
+    def __init__(self, value, source, full_history=True):
         self.history = []
         self.value = value
+        self.full_history = full_history
         self.addToHistory("SET", value, source)
 
+    def copy(self):
+        result = SectionKey.__new__(SectionKey)
+        result.value = self.value
+        result.history = list(self.history)
+        result.full_history = self.full_history
+        return result
+
     @property
     def source(self):
         return self.history[-1].source
@@ -107,7 +137,7 @@ class SectionKey(object):
         if sectionkey.history[-1].operation not in ['ADD', 'REMOVE']:
             self.addToHistory("OVERRIDE", sectionkey.value, sectionkey.source)
         else:
-            self.history = copy.deepcopy(sectionkey.history)
+            self.history = list(sectionkey.history)
 
     def setDirectory(self, value):
         self.value = value
@@ -129,7 +159,10 @@ class SectionKey(object):
 
     def addToHistory(self, operation, value, source):
         item = HistoryItem(operation, value, source)
-        self.history.append(item)
+        if self.full_history or operation in ('ADD', 'REMOVE'):
+            self.history.append(item)
+        else:
+            self.history = [item]
 
     def printAll(self, key, basedir, verbose):
         self.printKeyAndValue(key)
@@ -159,7 +192,7 @@ class SectionKey(object):
 
     def printTerse(self, basedir):
         toprint = []
-        history = copy.deepcopy(self.history)
+        history = list(self.history)
         while history:
             next = history.pop()
             if next.operation in ["ADD", "REMOVE"]:
@@ -178,6 +211,9 @@ class SectionKey(object):
 
 
 class HistoryItem(object):
+
+    __slots__ = 'operation', 'value', 'source'
+
     def __init__(self, operation, value, source):
         self.operation = operation
         self.value = value
@@ -225,9 +261,9 @@ class HistoryItem(object):
             self.operation, " ".join(self.value.split('\n')), self.source)
 
 
-def _annotate(data, note):
+def _annotate(data, note, full_history=True):
     for key in data:
-        data[key] = _annotate_section(data[key], note)
+        data[key] = _annotate_section(data[key], note, full_history)
     return data
 
 
@@ -305,20 +341,145 @@ def _get_user_config():
     return os.path.join(buildout_home, 'default.cfg')
 
 
+# Bump this when the cached configuration data changes shape.
+_config_cache_format = 2
+
+
+def _config_cache_file(download_options, defaults, config_file, cl_extends,
+                       cloptions, full_history):
+    """Return the path of the compiled configuration for this run, if any.
+
+    The name is a digest of everything, except the contents of the
+    configuration files themselves, that influences the merged
+    configuration.
+    """
+    if 'config-cache' not in download_options:
+        return None
+    cache = download_options['config-cache'].value
+    if not cache:
+        return None
+    if '${' in cache:
+        raise zc.buildout.UserError(
+            "config-cache '%s' may not contain ${section:variable} to expand."
+            % cache)
+    cache = os.path.expanduser(cache)
+    if not os.path.isabs(cache):
+        if 'directory' in defaults['buildout']:
+            cache = os.path.join(defaults['buildout']['directory'].value,
+                                 cache)
+        cache = os.path.abspath(cache)
+    if not os.path.isdir(cache):
+        os.makedirs(cache)
+
+    key = json.dumps([
+        _config_cache_format, full_history,
+        sys.version, sys.platform, sys.executable, os.getcwd(),
+        config_file, cl_extends and cl_extends.value,
+        _unannotate(defaults), _unannotate(cloptions),
+        ], sort_keys=True)
+    return os.path.join(
+        cache, hashlib.sha256(key.encode()).hexdigest() + '.json')
+
+
+def _config_cache_stat(path):
+    try:
+        st = os.stat(path)
+    except OSError:
+        return None
+    return st.st_mtime_ns, st.st_size, st.st_ino
+
+
+def _load_config_cache(path, allow_urls, full_history):
+    """Return the cached configuration data, if it is still up to date.
+
+    Configurations read from URLs are only trusted if allow_urls is true,
+    which is the case in non-newest mode.  The full_history setting of
+    the options is the one the cache file name was computed with.
+
+    Returns the data and the names of the optional extends that were
+    missing, or None.
+    """
+    try:
+        with open(path) as f:
+            sources, data, missing = json.load(f)
+        for source, stat in sources.items():
+            if _isurl(source):
+                if not allow_urls:
+                    return None
+            elif _config_cache_stat(source) != (stat and tuple(stat)):
+                return None
+        data = dict(
+            (section, dict(
+                (key, _sectionkey_from_json(value, full_history))
+                for (key, value) in options.items()))
+            for (section, options) in data.items())
+    except Exception:
+        return None
+    logging.getLogger('zc.buildout').debug(
+        'Using compiled configuration %s', path)
+    return data, [name for (_, name) in missing]
+
+
+def _save_config_cache(path, data, downloaded, missing):
+    sources = dict.fromkeys(path for (path, _) in missing)
+    for source in downloaded:
+        sources[source] = None if _isurl(source) else _config_cache_stat(source)
+    data = dict(
+        (section, dict(
+            (key, _sectionkey_to_json(value))
+            for (key, value) in options.items()))
+        for (section, options) in data.items())
+    with zc.buildout.utils.atomic_write(path) as f:
+        json.dump([sources, data, missing], f)
+
+
+def _sectionkey_to_json(sectionkey):
+    return [sectionkey.value,
+            [[item.operation, item.value, item.source]
+             for item in sectionkey.history]]
+
+
+def _sectionkey_from_json(data, full_history):
+    value, history = data
+    sectionkey = SectionKey.__new__(SectionKey)
+    sectionkey.value = value
+    sectionkey.history = [HistoryItem(*item) for item in history]
+    sectionkey.full_history = full_history
+    return sectionkey
+
+
 @commands
 class Buildout(DictMixin):
 
     COMMANDS = set()
 
+    # Set by install, see Options._initialize.
+    _lazy_recipes = False
+
+    # Whether parts are being installed in threads, see Options._call.
+    _installing_in_parallel = False
+
+    # The directory to save profiles of recipes in, see _profiled.
+    _profile_recipes = None
+
+    # Set by install, see _save_installed_options.
+    _installed_format = 'cfg'
+    _installed_written = None
+
     def __init__(self, config_file, cloptions,
                  use_user_defaults=True,
                  command=None, args=()):
 
         __doing__ = 'Initializing.'
 
+        # Only verbose annotation shows the full history of options.
+        full_history = command in (None, 'annotate')
+
         # default options
         _buildout_default_options_copy = copy.deepcopy(
             _buildout_default_options)
+        for sectionkey in _buildout_default_options_copy.values():
+            sectionkey.full_history = full_history
         data = dict(buildout=_buildout_default_options_copy)
         self._buildout_dir = os.getcwd()
 
@@ -332,7 +493,7 @@ class Buildout(DictMixin):
                     # with methods is breaking down. :(
                     config_file = None
                     data['buildout']['directory'] = SectionKey(
-                        '.', 'COMPUTED_VALUE')
+                        '.', 'COMPUTED_VALUE', full_history)
                 else:
                     raise zc.buildout.UserError(
                         "Couldn't open %s" % config_file)
@@ -342,10 +503,12 @@ class Buildout(DictMixin):
 
             if config_file:
                 data['buildout']['directory'] = SectionKey(
-                    os.path.dirname(config_file), 'COMPUTED_VALUE')
+                    os.path.dirname(config_file), 'COMPUTED_VALUE',
+                    full_history)
 
         cloptions = dict(
-            (section, dict((option, SectionKey(value, 'COMMAND_LINE_VALUE'))
+            (section, dict((option, SectionKey(value, 'COMMAND_LINE_VALUE',
+                                               full_history))
                            for (_, option, value) in v))
             for (section, v) in itertools.groupby(sorted(cloptions),
                                                   lambda v: v[0])
@@ -359,37 +522,71 @@ class Buildout(DictMixin):
             user_defaults, _ = _open(
                 os.path.dirname(user_config),
                 user_config, [], download_options,
-                override, set(), {}
+                override, set(), {}, full_history=full_history,
             )
             for_download_options = _update(data, user_defaults)
         else:
             user_defaults = {}
             for_download_options = copy.deepcopy(data)
 
-        # load configuration files
-        if config_file:
-            download_options = for_download_options['buildout']
-            cfg_data, _ = _open(
-                os.path.dirname(config_file),
-                config_file, [], download_options,
-                override, set(), user_defaults
-            )
-            data = _update(data, cfg_data)
-
-        # extends from command-line
+        cl_extends = None
         if 'buildout' in cloptions:
             cl_extends = cloptions['buildout'].pop('extends', None)
+
+        # Maybe we can reuse the merged configuration of a previous run.
+        download_options = _update_section(
+            for_download_options['buildout'], override)
+        config_cache = _config_cache_file(
+            download_options, for_download_options, config_file, cl_extends,
+            cloptions, full_history)
+        cached = None
+        if config_cache:
+            cached = _load_config_cache(
+                config_cache,
+                not bool_option(_unannotate_section(download_options),
+                                'newest'),
+                full_history)
+        if cached is not None:
+            data, missing = cached
+            for name in missing:
+                print("optional-extends file not found: %s" % name)
+        else:
+            sources = []
+            missing = []
+            parsed = {}
+
+            # load configuration files
+            if config_file:
+                download_options = for_download_options['buildout']
+                sources.append(set())
+                cfg_data, _ = _open(
+                    os.path.dirname(config_file),
+                    config_file, [], download_options,
+                    override, sources[-1], user_defaults,
+                    missing=missing, parsed=parsed,
+                    full_history=full_history,
+                )
+                data = _update(data, cfg_data)
+
+            # extends from command-line
             if cl_extends:
                 for extends in cl_extends.value.split():
                     download_options = for_download_options['buildout']
+                    sources.append(set())
                     cfg_data, _ = _open(
                         os.path.dirname(extends),
                         os.path.basename(extends),
                         [], download_options,
-                        override, set(), user_defaults
+                        override, sources[-1], user_defaults,
+                        missing=missing, parsed=parsed,
+                        full_history=full_history,
                     )
                     data = _update(data, cfg_data)
 
+            if config_cache:
+                _save_config_cache(
+                    config_cache, data, set().union(*sources), missing)
+
         # apply command-line options
         data = _update(data, cloptions)
 
@@ -450,7 +647,9 @@ class Buildout(DictMixin):
         # and considering the location of the configuration file that generated
         # the setting as the base path, falling back to the main configuration
         # file location
-        for name in ('download-cache', 'eggs-directory', 'extends-cache'):
+        for name in ('download-cache', 'eggs-directory', 'extends-cache',
+                     'config-cache', 'working-set-cache',
+                     'dir-hash-cache', 'profile-recipes-directory'):
             if name in data['buildout']:
                 sectionkey = data['buildout'][name]
                 origdir = sectionkey.value
@@ -477,9 +676,10 @@ class Buildout(DictMixin):
                     if not os.path.isabs(absdir):
                         absdir = os.path.join(basedir, absdir)
                     absdir = os.path.abspath(absdir)
+                    sectionkey = data['buildout'][name] = sectionkey.copy()
                     sectionkey.setDirectory(absdir)
 
-        self._annotated = copy.deepcopy(data)
+        self._annotated = data
         self._raw = _unannotate(data)
         self._data = {}
         self._parts = []
@@ -577,6 +777,17 @@ class Buildout(DictMixin):
 
         download_cache = options.get('download-cache')
         extends_cache = options.get('extends-cache')
+        # Check the option used by zc.buildout.download.Download.
+        bool_option(options, 'download-cache-dedupe', 'false')
+        config_cache = options.get('config-cache')
+
+        self._cache_max_sizes = []
+        for cache, name in ((download_cache, 'download-cache-max-size'),
+                            (extends_cache, 'extends-cache-max-size')):
+            max_size = _size_option(options, name)
+            if cache and max_size is not None:
+                self._cache_max_sizes.append(
+                    (os.path.join(options['directory'], cache), max_size))
 
         # Since zc.buildout version 5 we maintain separate directories for each
         # buildout eggs format version.  Current idea: we use v5 from zc.buildout
@@ -601,7 +812,8 @@ class Buildout(DictMixin):
 
         eggs_cache = options.get('eggs-directory')
 
-        for cache in [download_cache, extends_cache, eggs_cache]:
+        for cache in [download_cache, extends_cache, config_cache,
+                      eggs_cache]:
             if cache:
                 cache = os.path.join(options['directory'], cache)
                 if not os.path.exists(cache):
@@ -624,6 +836,29 @@ class Buildout(DictMixin):
                     )
             zc.buildout.easy_install.install_from_cache(True)
 
+        working_set_cache = options.get('working-set-cache')
+        if working_set_cache:
+            working_set_cache = os.path.join(
+                options['directory'], working_set_cache)
+            if not os.path.exists(working_set_cache):
+                os.makedirs(working_set_cache)
+            zc.buildout.easy_install.working_set_cache(working_set_cache)
+
+        zc.buildout.easy_install.eggs_directory_index(
+            bool_option(options, 'eggs-directory-index', 'false'))
+
+        dir_hash_cache = options.get('dir-hash-cache')
+        if dir_hash_cache:
+            dir_hash_cache = os.path.join(options['directory'],
+                                          dir_hash_cache)
+        _configure_dir_hash(dir_hash_cache,
+                            options.get('dir-hash-ignore', '').split())
+
+        if bool_option(options, 'profile-recipes', 'false'):
+            self._profile_recipes = os.path.join(
+                options['directory'],
+                options.get('profile-recipes-directory', 'profiles'))
+
         # "Use" each of the defaults so they aren't reported as unused options.
         for name in _buildout_default_options:
             options[name]
@@ -753,34 +988,70 @@ class Buildout(DictMixin):
     def install(self, install_args):
         __doing__ = 'Installing.'
 
+        config_digest = None
+        if not install_args:
+            config_digest = self._config_digest()
+        if config_digest is not None:
+            if self._unchanged_since_last_run(config_digest):
+                self._logger.info('Nothing changed since the last run.')
+                return
+            # If we don't finish, the next run must do the work.
+            run_file = self._run_file()
+            if os.path.exists(run_file):
+                os.remove(run_file)
+
         self._update_sys_path()
         self._load_extensions()
         self._setup_directories()
 
         # Check for updates. This could cause the process to be restarted
-        self._maybe_upgrade()
+        with _timed('Checking for upgrades'):
+            self._maybe_upgrade()
 
         # load installed data
+        self._installed_format = self['buildout'].get(
+            'installed-format', 'cfg')
+        if self._installed_format not in ('cfg', 'journal'):
+            raise zc.buildout.UserError(
+                "Invalid value for installed-format option: %s"
+                % self._installed_format)
         (installed_part_options, installed_exists
          )= self._read_installed_part_options()
 
-        # Remove old develop eggs
-        self._uninstall(
-            installed_part_options['buildout'].get(
-                'installed_develop_eggs', '')
-            )
+        # Remove old develop eggs, except those of develop directories
+        # that didn't change, if we may reuse them.
+        develop_fingerprints = None
+        reuse = {}
+        if bool_option(self['buildout'], 'skip-unchanged-develop', 'false'):
+            develop_fingerprints = {}
+            reuse = self._unchanged_develop(
+                installed_part_options['buildout'].get(
+                    'develop_fingerprints', ''))
+        keep = set(f for files in reuse.values() for f in files)
+        self._uninstall('\n'.join(
+            f for f in installed_part_options['buildout'].get(
+                'installed_develop_eggs', '').split('\n')
+            if f not in keep))
 
         # Build develop eggs
-        installed_develop_eggs = self._develop()
+        with _timed('Developing'):
+            installed_develop_eggs = self._develop(
+                reuse, develop_fingerprints)
         # Update sys.path again in case new develop eggs were created
         self._update_sys_path()
 
         installed_part_options['buildout']['installed_develop_eggs'
                                            ] = installed_develop_eggs
+        develop_options = dict(installed_develop_eggs=installed_develop_eggs)
+        if develop_fingerprints is not None:
+            develop_options['develop_fingerprints'] = json.dumps(
+                develop_fingerprints, sort_keys=True)
+            installed_part_options['buildout']['develop_fingerprints'
+                                               ] = develop_options[
+                                                   'develop_fingerprints']
 
         if installed_exists:
-            self._update_installed(
-                installed_develop_eggs=installed_develop_eggs)
+            self._update_installed(**develop_options)
 
         # get configured and installed part lists
         conf_parts = self['buildout']['parts']
@@ -795,7 +1066,10 @@ class Buildout(DictMixin):
             install_parts = conf_parts
             uninstall_missing = True
 
-        # load and initialize recipes
+        # load and initialize recipes.  With lazy-recipes, recipes are
+        # only constructed when they're needed, see Options._initialize.
+        self._lazy_recipes = bool_option(
+            self['buildout'], 'lazy-recipes', 'false')
         [self[part]['recipe'] for part in install_parts]
         if not install_args:
             install_parts = self._parts
@@ -811,7 +1085,17 @@ class Buildout(DictMixin):
 
 
         # compute new part recipe signatures
-        self._compute_part_signatures(install_parts)
+        with _timed('Computing signatures'):
+            self._compute_part_signatures(install_parts)
+            _save_dir_hash_cache()
+
+        self._verify_installed = self['buildout'].get(
+            'verify-installed-files', 'exists')
+        if self._verify_installed not in ('exists', 'scandir', 'manifest'):
+            raise zc.buildout.UserError(
+                "Invalid value for verify-installed-files option: %s"
+                % self._verify_installed)
+        verify_workers = _workers_option(self['buildout'], 'verify-workers')
 
         # uninstall parts that are no-longer used or who's configs
         # have changed
@@ -819,17 +1103,43 @@ class Buildout(DictMixin):
             if part in install_parts:
                 old_options = installed_part_options[part].copy()
                 installed_files = old_options.pop('__buildout_installed__')
+                manifest = old_options.pop('__buildout_manifest__', None)
+                configured = old_options.pop('__buildout_configured__', None)
+                old_options.pop('__buildout_unused__', None)
                 new_options = self.get(part)
-                if old_options == new_options:
+                if new_options._lazy and configured is None:
+                    # The part was installed without lazy-recipes, so we
+                    # have to compare all of its options.
+                    new_options._construct()
+                if new_options._lazy:
+                    # The recipe wasn't constructed, so compare the
+                    # options as configured.
+                    same = (
+                        configured == new_options._configured and
+                        old_options.get('__buildout_signature__') ==
+                        new_options['__buildout_signature__'])
+                else:
+                    same = old_options == new_options
+                if same:
                     # The options are the same, but are all of the
                     # installed files still there?  If not, we should
                     # reinstall.
                     if not installed_files:
                         continue
-                    for f in installed_files.split('\n'):
-                        if not os.path.exists(self._buildout_path(f)):
-                            break
-                    else:
+                    paths = [self._buildout_path(f)
+                             for f in installed_files.split('\n')]
+                    if self._verify_installed == 'exists':
+                        for path in paths:
+                            if not os.path.exists(path):
+                                break
+                        else:
+                            continue
+                    elif (manifest is not None and
+                          manifest == _installed_manifest(paths)):
+                        # None of the directories containing the
+                        # files changed, so the files are still there.
+                        continue
+                    elif _installed_files_exist(paths, verify_workers):
                         continue
 
                 # output debugging info
@@ -851,87 +1161,213 @@ class Buildout(DictMixin):
             elif not uninstall_missing:
                 continue
 
-            self._uninstall_part(part, installed_part_options)
+            with _timed('Uninstalling %s' % part, 'part'):
+                self._uninstall_part(part, installed_part_options)
             installed_parts = [p for p in installed_parts if p != part]
 
             if installed_exists:
                 self._update_installed(parts=' '.join(installed_parts))
 
+        # Construct the recipes of the parts we have to install.  Parts
+        # that are still installed are unchanged, and aren't updated.
+        for part in install_parts:
+            if self[part]._lazy and part not in installed_parts:
+                self[part]._construct()
+
+        workers = _workers_option(self['buildout'], 'parallel-parts')
+
         # Check for unused buildout options:
         _check_for_unused_options_in_section(self, 'buildout')
 
-        # install new parts
-        for part in install_parts:
-            signature = self[part].pop('__buildout_signature__')
-            saved_options = self[part].copy()
-            recipe = self[part].recipe
-            if part in installed_parts: # update
-                need_to_save_installed = False
-                __doing__ = 'Updating %s.', part
-                self._logger.info(*__doing__)
-                old_options = installed_part_options[part]
-                old_installed_files = old_options['__buildout_installed__']
+        # install new parts, each of which says what we're doing
+        __doing__ = None
+        installed_parts, installed_exists = self._install_parts(
+            install_parts, installed_parts, installed_part_options,
+            installed_exists, workers)
 
-                try:
-                    update = recipe.update
-                except AttributeError:
-                    update = recipe.install
-                    self._logger.warning(
-                        "The recipe for %s doesn't define an update "
-                        "method. Using its install method.",
-                        part)
+        if installed_develop_eggs:
+            if not installed_exists:
+                self._save_installed_options(installed_part_options)
+        elif (not installed_parts) and installed_exists:
+            os.remove(self['buildout']['installed'])
 
-                try:
-                    installed_files = self[part]._call(update)
-                except Exception:
-                    installed_parts.remove(part)
-                    self._uninstall(old_installed_files)
-                    if installed_exists:
-                        self._update_installed(
-                            parts=' '.join(installed_parts))
-                    raise
+        if config_digest is not None:
+            self._record_run(config_digest, installed_part_options)
 
-                old_installed_files = old_installed_files.split('\n')
-                if installed_files is None:
-                    installed_files = old_installed_files
-                else:
-                    if isinstance(installed_files, str):
-                        installed_files = [installed_files]
-                    else:
-                        installed_files = list(installed_files)
+        if self.show_picked_versions or self.update_versions_file:
+            with _timed('Printing picked versions'):
+                self._print_picked_versions()
+        self._print_namespace_packages()
+        self._unload_extensions()
+        self._prune_caches()
 
-                    need_to_save_installed = [
-                        p for p in installed_files
-                        if p not in old_installed_files]
+    def _prune_caches(self):
+        for directory, max_size in self._cache_max_sizes:
+            if os.path.isdir(directory):
+                with _timed('Pruning %s' % directory):
+                    zc.buildout.download.prune(
+                        directory, max_size, self._logger)
 
-                    if need_to_save_installed:
-                        installed_files = (old_installed_files
-                                           + need_to_save_installed)
+    # Bump this when the format of run files changes.
+    _run_file_format = 2
 
-            else: # install
-                need_to_save_installed = True
-                __doing__ = 'Installing %s.', part
-                self._logger.info(*__doing__)
-                installed_files = self[part]._call(recipe.install)
-                if installed_files is None:
-                    self._logger.warning(
-                        "The %s install returned None.  A path or "
-                        "iterable os paths should be returned.",
-                        part)
-                    installed_files = ()
-                elif isinstance(installed_files, str):
-                    installed_files = [installed_files]
-                else:
-                    installed_files = list(installed_files)
+    def _run_file(self):
+        return self['buildout']['installed'] + '.run'
+
+    def _config_digest(self):
+        """Return a digest of the configuration, if runs can be skipped.
 
+        Runs can only be skipped with the skip-unchanged-run option, if
+        we don't look for newer distributions and there are no extensions,
+        which could do anything.
+        """
+        options = self['buildout']
+        if not (bool_option(options, 'skip-unchanged-run', 'false')
+                and options['installed']
+                and not self.newest
+                and not options.get('extensions', '').split()
+                and not self.show_picked_versions
+                and not self.update_versions_file):
+            return None
+        data = json.dumps([
+            self._run_file_format, sys.version, sys.executable,
+            __file__, os.stat(__file__).st_mtime_ns,
+            sorted((section, sorted(values.items()))
+                   for section, values in self._raw.items()),
+            ])
+        return md5(data.encode()).hexdigest()
+
+    def _run_state(self, recipes):
+        """Return a digest of the state a run leaves behind.
+
+        That's the installed database, the develop directories, the
+        directories distributions are installed in and the distributions
+        recipes were loaded from.  Recipes are given as (location,
+        develop) pairs; the files of develop distributions are looked at,
+        other distributions are only checked for a new modification time.
+        """
+        options = self['buildout']
+        try:
+            with open(options['installed'], 'rb') as f:
+                installed = f.read()
+        except OSError:
+            return None
+        hash = md5(installed)
+        for setup in options.get('develop', '').split():
+            for path in sorted(glob.glob(self._buildout_path(setup))):
+                hash.update(path.encode())
+                hash.update(_dir_state(path).encode())
+        for name in ('eggs-directory', 'develop-eggs-directory'):
+            try:
+                mtime = os.stat(options[name]).st_mtime_ns
+            except OSError:
+                mtime = None
+            hash.update(repr((options[name], mtime)).encode())
+        for location, develop in recipes:
+            if develop:
+                hash.update(repr((location, _dir_state(location))).encode())
+                continue
+            try:
+                mtime = os.stat(location).st_mtime_ns
+            except OSError:
+                mtime = None
+            hash.update(repr((location, mtime)).encode())
+        return hash.hexdigest()
+
+    def _recipe_locations(self, installed_part_options):
+        """Return the locations of the distributions recipes came from."""
+        requirements = set()
+        for part in installed_part_options['buildout']['parts'].split():
+            requirements.add(_recipe(installed_part_options[part])[0])
+        locations = set()
+        for requirement in requirements:
+            for dist in pkg_resources.working_set.resolve(
+                    [pkg_resources.Requirement.parse(requirement)]):
+                locations.add((dist.location,
+                               dist.precedence == pkg_resources.DEVELOP_DIST))
+        return sorted(locations)
+
+    def _record_run(self, config_digest, installed_part_options):
+        try:
+            recipes = self._recipe_locations(installed_part_options)
+        except pkg_resources.ResolutionError:
+            return
+        state = self._run_state(recipes)
+        if state is None:
+            return
+        installed_files = []
+        for part in installed_part_options['buildout']['parts'].split():
+            installed_files.extend(
+                f for f in installed_part_options[part][
+                    '__buildout_installed__'].split('\n')
+                if f)
+        with zc.buildout.utils.atomic_write(self._run_file()) as f:
+            json.dump(dict(config=config_digest, state=state,
+                           recipes=recipes, installed=installed_files), f)
+
+    def _unchanged_since_last_run(self, config_digest):
+        """Tell whether a run would find nothing to do.
+
+        That's the case if the configuration and the state left behind
+        by the last run are the same, and the installed files still
+        exist.  Recipes aren't loaded to find out.
+        """
+        try:
+            with open(self._run_file()) as f:
+                run = json.load(f)
+        except (OSError, ValueError):
+            return False
+        if run['config'] != config_digest:
+            return False
+        if run['state'] != self._run_state(run['recipes']):
+            return False
+        for f in run['installed']:
+            if not os.path.exists(self._buildout_path(f)):
+                return False
+        return True
+
+    def _install_parts(self, install_parts, installed_parts,
+                       installed_part_options, installed_exists, workers):
+        """Install or update parts, recording each one when it's done.
+
+        With more than one worker, parts that don't depend on each other
+        are installed at the same time.  Returns the new installed parts
+        and whether the installed file exists.
+        """
+        # Installed parts are recorded in the order of install_parts, after
+        # the other installed parts, whatever order they're installed in,
+        # so the installed database is the same from one run to the next.
+        order = dict((part, i) for (i, part) in enumerate(install_parts))
+
+        def record(part, result):
+            nonlocal installed_parts, installed_exists
+            saved_options, installed_files, need_to_save_installed = result
+            old_manifest = installed_part_options.get(part, {}).get(
+                '__buildout_manifest__')
             installed_part_options[part] = saved_options
             saved_options['__buildout_installed__'
                           ] = '\n'.join(installed_files)
-            saved_options['__buildout_signature__'] = signature
+            saved_options.pop('__buildout_manifest__', None)
+            if self._verify_installed == 'manifest' and installed_files:
+                manifest = _installed_manifest(
+                    [self._buildout_path(f) for f in installed_files])
+                if manifest is not None:
+                    saved_options['__buildout_manifest__'] = manifest
+            if saved_options.get('__buildout_manifest__') != old_manifest:
+                need_to_save_installed = True
 
             installed_parts = [p for p in installed_parts if p != part]
             installed_parts.append(part)
-            _check_for_unused_options_in_section(self, part)
+            if workers > 1:
+                installed_parts.sort(key=lambda p: (p in order, order.get(p)))
+            if self[part]._lazy:
+                # The recipe wasn't constructed, so check the options it
+                # didn't use when it was.
+                _check_for_unused_options_in_section(
+                    self, part,
+                    saved_options.get('__buildout_unused__', '').split())
+            else:
+                _check_for_unused_options_in_section(self, part)
 
             if need_to_save_installed:
                 installed_part_options['buildout']['parts'] = (
@@ -942,19 +1378,206 @@ class Buildout(DictMixin):
                 assert installed_exists
                 self._update_installed(parts=' '.join(installed_parts))
 
-        if installed_develop_eggs:
-            if not installed_exists:
-                self._save_installed_options(installed_part_options)
-        elif (not installed_parts) and installed_exists:
-            os.remove(self['buildout']['installed'])
+        def failed(part):
+            nonlocal installed_parts
+            if part in installed_parts: # update
+                old_installed_files = installed_part_options[part][
+                    '__buildout_installed__']
+                installed_parts.remove(part)
+                self._uninstall(old_installed_files)
+                if installed_exists:
+                    self._update_installed(
+                        parts=' '.join(installed_parts))
+
+        if workers < 2 or len(install_parts) < 2:
+            for part in install_parts:
+                try:
+                    result = self._install_part(
+                        part, installed_parts, installed_part_options)
+                except Exception:
+                    failed(part)
+                    raise
+                record(part, result)
+            return installed_parts, installed_exists
+
+        dependencies = dict(
+            (part, self._part_dependencies(part, install_parts))
+            for part in install_parts)
+        pending = list(install_parts)
+        running = {}
+        done = set()
+        error = None
+        # Recipes are called in the buildout directory.  The threads
+        # share the current directory, so change to it once, rather than
+        # around each call.
+        os.chdir(self['buildout']['directory'])
+        self._installing_in_parallel = True
+        try:
+            with concurrent.futures.ThreadPoolExecutor(workers) as executor:
+                while pending or running:
+                    if error is None:
+                        ready = [part for part in pending
+                                 if dependencies[part] <= done]
+                        if not ready and not running:
+                            # Parts that depend on each other.  Install them
+                            # in the usual order.
+                            self._logger.warning(
+                                "Parts depend on each other: %s. Installing %s"
+                                " first.",
+                                ' -> '.join(_dependency_cycle(
+                                    pending[0], dependencies, pending)),
+                                pending[0])
+                            ready = pending[:1]
+                        for part in ready[:workers - len(running)]:
+                            pending.remove(part)
+                            future = executor.submit(
+                                self._install_part,
+                                part, installed_parts, installed_part_options)
+                            running[future] = part
+                    if not running:
+                        break
+                    finished, _ = concurrent.futures.wait(
+                        running,
+                        return_when=concurrent.futures.FIRST_COMPLETED)
+                    for future in sorted(finished,
+                                         key=lambda f: install_parts.index(
+                                             running[f])):
+                        part = running.pop(future)
+                        done.add(part)
+                        try:
+                            result = future.result()
+                        except Exception as v:
+                            # Let the parts that are running finish, so we
+                            # record them, but don't start any more.
+                            failed(part)
+                            if error is None:
+                                error = v
+                        else:
+                            record(part, result)
+        finally:
+            self._installing_in_parallel = False
+            os.chdir(self['buildout']['directory'])
 
-        if self.show_picked_versions or self.update_versions_file:
-            self._print_picked_versions()
-        self._print_namespace_packages()
-        self._unload_extensions()
+        if error is not None:
+            raise error
+        return installed_parts, installed_exists
+
+    def _install_part(self, part, installed_parts, installed_part_options):
+        """Call the recipe to install or update a part.
+
+        Returns the options to save, the installed files and whether
+        installed files were added.
+        """
+        if self[part]._lazy:
+            # The part is unchanged, so there's nothing to do.
+            self._logger.debug('Part %s is unchanged.', part)
+            saved_options = installed_part_options[part]
+            return (saved_options,
+                    saved_options['__buildout_installed__'].split('\n'),
+                    False)
+
+        signature = self[part].pop('__buildout_signature__')
+        saved_options = self[part].copy()
+        recipe = self[part].recipe
+        if part in installed_parts: # update
+            need_to_save_installed = False
+            __doing__ = 'Updating %s.', part
+            self._logger.info(*__doing__)
+            old_options = installed_part_options[part]
+            old_installed_files = old_options['__buildout_installed__']
+
+            try:
+                update = recipe.update
+            except AttributeError:
+                update = recipe.install
+                self._logger.warning(
+                    "The recipe for %s doesn't define an update "
+                    "method. Using its install method.",
+                    part)
+
+            installed_files = self[part]._call(update)
+
+            old_installed_files = old_installed_files.split('\n')
+            if installed_files is None:
+                installed_files = old_installed_files
+            else:
+                if isinstance(installed_files, str):
+                    installed_files = [installed_files]
+                else:
+                    installed_files = list(installed_files)
+
+                need_to_save_installed = [
+                    p for p in installed_files
+                    if p not in old_installed_files]
+
+                if need_to_save_installed:
+                    installed_files = (old_installed_files
+                                       + need_to_save_installed)
+
+        else: # install
+            need_to_save_installed = True
+            __doing__ = 'Installing %s.', part
+            self._logger.info(*__doing__)
+            installed_files = self[part]._call(recipe.install)
+            if installed_files is None:
+                self._logger.warning(
+                    "The %s install returned None.  A path or "
+                    "iterable os paths should be returned.",
+                    part)
+                installed_files = ()
+            elif isinstance(installed_files, str):
+                installed_files = [installed_files]
+            else:
+                installed_files = list(installed_files)
+
+        saved_options['__buildout_signature__'] = signature
+        if self[part]._configured is not None:
+            saved_options['__buildout_configured__'] = self[part]._configured
+            unused = _unused_options(self[part])
+            if unused:
+                saved_options['__buildout_unused__'] = ' '.join(unused)
+        return saved_options, installed_files, need_to_save_installed
+
+    def _part_dependencies(self, part, parts):
+        """Return the parts, among parts, that a part uses.
+
+        These are the parts referenced by the part's options or listed in
+        its ``<part-dependencies>``, directly or through other sections.
+        """
+        result = set()
+        seen = set()
+        todo = [part]
+        while todo:
+            name = todo.pop()
+            if name in seen:
+                continue
+            seen.add(name)
+            if name != part and name in parts:
+                result.add(name)
+                continue
+            options = self._data.get(name)
+            if options is not None:
+                raw = options._raw
+            else:
+                raw = self._raw.get(name, {})
+            for value in raw.values():
+                if '${' in value:
+                    for section, option in self.Options._compile(value)[1]:
+                        todo.append(section or name)
+            todo.extend(raw.get('<part-dependencies>', '').split())
+            todo.extend(raw.get('<', '').split())
+        return result
 
     def _update_installed(self, **buildout_options):
         installed = self['buildout']['installed']
+        if self._installed_format == 'journal':
+            written = self._installed_written
+            if written is not None and 'buildout' in written:
+                written['buildout'] = dict(written['buildout'],
+                                           **buildout_options)
+            _append_installed_journal(
+                installed, [['update', buildout_options]])
+            return
         f = open(installed, 'a')
         f.write('\n[buildout]\n')
         for option, value in list(buildout_options.items()):
@@ -990,12 +1613,17 @@ class Buildout(DictMixin):
                 self._logger.info('Creating directory %r.', d)
                 os.mkdir(d)
 
-    def _develop(self):
+    def _develop(self, reuse=None, fingerprints=None):
         """Install sources by running in editable mode.
 
         Traditionally: run `setup.py develop` on them.
         Nowadays: run `pip install -e` on them, as there may not be a `setup.py`,
         but `pyproject.toml` instead, using for example `hatchling`.
+
+        The files in `reuse`, a mapping from develop directories to
+        the files installed for them, are kept rather than installing the
+        directories again.  If `fingerprints` is given, it's updated with
+        the fingerprint and installed files of each directory.
         """
         __doing__ = 'Processing directories listed in the develop option'
 
@@ -1003,14 +1631,27 @@ class Buildout(DictMixin):
         if not develop:
             return ''
 
+        workers = _workers_option(self['buildout'], 'parallel-develop')
+
         dest = self['buildout']['develop-eggs-directory']
         old_files = os.listdir(dest)
+        if reuse is None:
+            reuse = {}
+
+        def develop_one(setup):
+            __doing__ = 'Processing develop directory %r.', setup
+            created = []
+            zc.buildout.easy_install.develop(setup, dest, created=created)
+            if fingerprints is not None:
+                fingerprints[setup] = [
+                    _develop_fingerprint(setup), sorted(created)]
 
         env = dict(os.environ,
                    PYTHONPATH=zc.buildout.easy_install.setuptools_pythonpath)
         here = os.getcwd()
         try:
             try:
+                setups = []
                 for setup in develop.split():
                     setup = self._buildout_path(setup)
                     files = glob.glob(setup)
@@ -1020,9 +1661,33 @@ class Buildout(DictMixin):
                     else:
                         files.sort()
                     for setup in files:
+                        if setup in reuse:
+                            self._logger.info("Develop: %r (unchanged)",
+                                              setup)
+                            if fingerprints is not None:
+                                fingerprints[setup] = [
+                                    _develop_fingerprint(setup),
+                                    reuse[setup]]
+                            continue
                         self._logger.info("Develop: %r", setup)
-                        __doing__ = 'Processing develop directory %r.', setup
-                        zc.buildout.easy_install.develop(setup, dest)
+                        if workers < 2:
+                            develop_one(setup)
+                        else:
+                            setups.append(setup)
+
+                if setups:
+                    # Make the editable installs at the same time.  Each
+                    # one is built in its own temporary directory.  If one
+                    # fails, we wait for those that are running, so we
+                    # can roll them back, and raise the first error.
+                    executor = concurrent.futures.ThreadPoolExecutor(workers)
+                    try:
+                        futures = [executor.submit(develop_one, setup)
+                                   for setup in setups]
+                        for future in futures:
+                            future.result()
+                    finally:
+                        executor.shutdown(wait=True, cancel_futures=True)
             except Exception:
                 # if we had an error, we need to roll back changes, by
                 # removing any files we created.
@@ -1040,6 +1705,7 @@ class Buildout(DictMixin):
                        for f in os.listdir(dest)
                        if f not in old_files
                        ]
+                res.extend(f for files in reuse.values() for f in files)
                 res.sort()
                 return '\n'.join(res)
 
@@ -1047,6 +1713,25 @@ class Buildout(DictMixin):
             os.chdir(here)
 
 
+    def _unchanged_develop(self, recorded):
+        """Return the files we can reuse for unchanged develop directories.
+
+        `recorded` has the fingerprints and installed files of develop
+        directories, as recorded by the last run.
+        """
+        if not recorded:
+            return {}
+        develop = set()
+        for setup in self['buildout'].get('develop', '').split():
+            develop.update(glob.glob(self._buildout_path(setup)))
+        result = {}
+        for setup, (fingerprint, files) in json.loads(recorded).items():
+            if (setup in develop
+                    and _develop_fingerprint(setup) == fingerprint
+                    and all(os.path.exists(f) for f in files)):
+                result[setup] = files
+        return result
+
     def _sanity_check_develop_eggs_files(self, dest, old_files):
         for f in os.listdir(dest):
             if f in old_files or f == '__pycache__':
@@ -1060,19 +1745,36 @@ class Buildout(DictMixin):
                     "Unexpected entry, %r, in develop-eggs directory.", f)
 
     def _compute_part_signatures(self, parts):
-        # Compute recipe signature and add to options
+        # Compute recipe signature and add to options.  Parts often use
+        # the same recipes, so compute the signature of each recipe
+        # requirement once.
+        signatures = {}
         for part in parts:
             options = self.get(part)
             if options is None:
                 options = self[part] = {}
             recipe, entry = _recipe(options)
-            req = pkg_resources.Requirement.parse(recipe)
-            sig = _dists_sig(pkg_resources.working_set.resolve([req]))
-            options['__buildout_signature__'] = ' '.join(sig)
+            sig = signatures.get(recipe)
+            if sig is None:
+                req = pkg_resources.Requirement.parse(recipe)
+                sig = signatures[recipe] = ' '.join(
+                    _dists_sig(pkg_resources.working_set.resolve([req])))
+            options['__buildout_signature__'] = sig
 
     def _read_installed_part_options(self):
         old = self['buildout']['installed']
+        self._installed_written = None
         if old and os.path.isfile(old):
+            journal = _read_installed_journal(old)
+            if journal is not None:
+                sections, compact = journal
+                result = dict(
+                    (section, self.Options(self, section, options))
+                    for section, options in sections.items())
+                if compact or self._installed_format != 'journal':
+                    self._save_installed_options(result)
+                return result, True
+
             fp = open(old)
             sections = zc.buildout.configparser.parse(fp, old)
             fp.close()
@@ -1085,6 +1787,8 @@ class Buildout(DictMixin):
                         options[option] = value
                 result[section] = self.Options(self, section, options)
 
+            if self._installed_format != 'cfg':
+                self._save_installed_options(result)
             return result, True
         else:
             return ({'buildout': self.Options(self, 'buildout', {'parts': ''})},
@@ -1134,6 +1838,8 @@ class Buildout(DictMixin):
         installed = self['buildout']['installed']
         if not installed:
             return
+        if self._installed_format == 'journal':
+            return self._save_installed_journal(installed, installed_options)
         f = open(installed, 'w')
         _save_options('buildout', installed_options['buildout'], f)
         for part in installed_options['buildout']['parts'].split():
@@ -1141,6 +1847,29 @@ class Buildout(DictMixin):
             _save_options(part, installed_options[part], f)
         f.close()
 
+    def _save_installed_journal(self, installed, installed_options):
+        """Record the sections that changed since they were last recorded.
+
+        The first time in a run, the journal is written from scratch, with
+        just the current sections.  After that, records are appended.
+        """
+        written = self._installed_written
+        rewrite = written is None or not os.path.exists(installed)
+        if rewrite:
+            written = self._installed_written = {}
+        records = []
+        for section in (['buildout'] +
+                        installed_options['buildout']['parts'].split()):
+            options = dict(installed_options[section].items())
+            if written.get(section) != options:
+                records.append(['section', section, options])
+                written[section] = options
+
+        if rewrite:
+            _write_installed_journal(installed, records)
+        else:
+            _append_installed_journal(installed, records)
+
     def _error(self, message, *args):
         raise zc.buildout.UserError(message % args)
 
@@ -1443,6 +2172,18 @@ The following list shows the affected packages and their namespaces:
             else:
                 _error('Section not found:', section)
 
+    @command
+    def cache_prune(self, args):
+        if args:
+            raise zc.buildout.UserError(
+                "The cache-prune command doesn't take arguments.")
+        if not self._cache_max_sizes:
+            raise zc.buildout.UserError(
+                "The cache-prune command requires a download-cache and a\n"
+                "download-cache-max-size option, or an extends-cache and an\n"
+                "extends-cache-max-size option.")
+        self._prune_caches()
+
     @command
     def annotate(self, args=None):
         verbose = self['buildout'].get('verbosity', 0) != 0
@@ -1519,39 +2260,61 @@ The following list shows the affected packages and their namespaces:
         return len(self._raw)
 
 
-def _install_and_load(spec, group, entry, buildout):
+def _dependency_cycle(part, dependencies, parts):
+    """Return a cycle of dependencies among parts, starting from part.
+
+    Each of the parts must depend on one of the others.
+    """
+    path = []
+    while part not in path:
+        path.append(part)
+        part = [p for p in parts if p in dependencies[part]][0]
+    return path[path.index(part):] + [part]
+
+def _install_recipe(spec, buildout):
+    """Install the distribution providing a recipe, if it isn't already.
+
+    Returns the requirement for it.
+    """
     __doing__ = 'Loading recipe %r.', spec
-    try:
-        req = pkg_resources.Requirement.parse(spec)
+    req = pkg_resources.Requirement.parse(spec)
+
+    buildout_options = buildout['buildout']
+    if pkg_resources.working_set.find(req) is None:
+        __doing__ = 'Installing recipe %s.', spec
+        if buildout.offline:
+            dest = None
+            path = [buildout_options['develop-eggs-directory'],
+                    buildout_options['eggs-directory'],
+                    ]
+        else:
+            dest = buildout_options['eggs-directory']
+            path = [buildout_options['develop-eggs-directory']]
 
-        buildout_options = buildout['buildout']
-        if pkg_resources.working_set.find(req) is None:
-            __doing__ = 'Installing recipe %s.', spec
-            if buildout.offline:
-                dest = None
-                path = [buildout_options['develop-eggs-directory'],
-                        buildout_options['eggs-directory'],
-                        ]
-            else:
-                dest = buildout_options['eggs-directory']
-                path = [buildout_options['develop-eggs-directory']]
-
-            # Pin versions when processing the buildout section
-            versions_section_name = buildout['buildout'].get('versions', 'versions')
-            versions = buildout.get(versions_section_name, {})
-            zc.buildout.easy_install.allow_picked_versions(
-                bool_option(buildout['buildout'], 'allow-picked-versions')
-                )
-            zc.buildout.easy_install.install(
-                [spec], dest,
-                links=buildout._links,
-                index=buildout_options.get('index'),
-                path=path,
-                working_set=pkg_resources.working_set,
-                newest=buildout.newest,
-                allow_hosts=buildout._allow_hosts,
-                versions=versions,
-                )
+        # Pin versions when processing the buildout section
+        versions_section_name = buildout['buildout'].get('versions', 'versions')
+        versions = buildout.get(versions_section_name, {})
+        zc.buildout.easy_install.allow_picked_versions(
+            bool_option(buildout['buildout'], 'allow-picked-versions')
+            )
+        zc.buildout.easy_install.install(
+            [spec], dest,
+            links=buildout._links,
+            index=buildout_options.get('index'),
+            path=path,
+            working_set=pkg_resources.working_set,
+            newest=buildout.newest,
+            allow_hosts=buildout._allow_hosts,
+            versions=versions,
+            )
+
+    return req
+
+def _install_and_load(spec, group, entry, buildout):
+    try:
+        # _install_recipe says what it's doing, so errors are reported
+        # once, as they were when it was part of this function.
+        req = _install_recipe(spec, buildout)
 
         __doing__ = 'Loading %s recipe entry %s:%s.', group, spec, entry
         return pkg_resources.load_entry_point(
@@ -1567,6 +2330,11 @@ def _install_and_load(spec, group, entry, buildout):
 
 class Options(DictMixin):
 
+    # With lazy-recipes, a digest of the options as configured, and
+    # whether the recipe hasn't been constructed yet, see _initialize.
+    _configured = None
+    _lazy = False
+
     def __init__(self, buildout, section, data):
         self.buildout = buildout
         self.name = section
@@ -1594,17 +2362,35 @@ class Options(DictMixin):
             self.buildout[dname]
 
         if self.get('recipe'):
-            self.initialize()
+            if self.buildout._lazy_recipes:
+                # Record the options as configured, before the recipe
+                # can change them, and only construct the recipe if we
+                # need to call it or if its options are used.  Options
+                # the recipe computes aren't compared, see the
+                # lazy-recipes documentation.
+                self._configured = md5(json.dumps(
+                    sorted(self.copy().items())).encode()).hexdigest()
+                _install_recipe(_recipe(self._data)[0], self.buildout)
+                self._lazy = True
+            else:
+                self.initialize()
             self.buildout._parts.append(name)
 
     def initialize(self):
         reqs, entry = _recipe(self._data)
         buildout = self.buildout
-        recipe_class = _install_and_load(reqs, 'zc.buildout', entry, buildout)
+        recipe_class = _profiled(
+            buildout, self.name + '.load',
+            _install_and_load, reqs, 'zc.buildout', entry, buildout)
 
         name = self.name
         self.recipe = recipe_class(buildout, name, self)
 
+    def _construct(self):
+        __doing__ = 'Initializing part %s.', self.name
+        self._lazy = False
+        self.initialize()
+
     def _do_extend_raw(self, name, data, doing):
         if name == 'buildout':
             return data
@@ -1628,7 +2414,7 @@ class Options(DictMixin):
                 result.update(self._do_extend_raw(iname, raw, doing))
 
             result = _annotate_section(result, "")
-            data = _annotate_section(copy.deepcopy(data), "")
+            data = _annotate_section(dict(data), "")
             result = _update_section(result, data)
             result = _unannotate_section(result)
             result.pop('<', None)
@@ -1638,9 +2424,8 @@ class Options(DictMixin):
 
     def _dosub(self, option, v):
         __doing__ = 'Getting option %s:%s.', self.name, option
-        seen = [(self.name, option)]
-        v = '$$'.join([self._sub(s, seen) for s in v.split('$$')])
-        self._cooked[option] = v
+        seen = {(self.name, option): None}
+        self._cooked[option] = self._sub(v, seen)
 
     def get(self, option, default=None, seen=None):
         try:
@@ -1652,22 +2437,30 @@ class Options(DictMixin):
         if v is None:
             v = self._raw.get(option)
             if v is None:
+                if self._lazy:
+                    # The recipe may provide the option.
+                    self._construct()
+                    return self.get(option, default, seen)
                 return default
 
         __doing__ = 'Getting option %s:%s.', self.name, option
 
         if '${' in v:
+            # seen is an ordered dict of the options being substituted,
+            # so we can report the cycle if there is one.
             key = self.name, option
             if seen is None:
-                seen = [key]
+                seen = {key: None}
             elif key in seen:
+                cycle = list(seen)
+                cycle = cycle[cycle.index(key):] + [key]
                 raise zc.buildout.UserError(
-                    "Circular reference in substitutions.\n"
-                    )
+                    "Circular reference in substitutions:\n  %s\n" %
+                    ' -> '.join('%s:%s' % k for k in cycle))
             else:
-                seen.append(key)
-            v = '$$'.join([self._sub(s, seen) for s in v.split('$$')])
-            seen.pop()
+                seen[key] = None
+            v = self._sub(v, seen)
+            del seen[key]
 
         self._data[option] = v
         return v
@@ -1675,32 +2468,59 @@ class Options(DictMixin):
     _template_split = re.compile('([$]{[^}]*})').split
     _simple = re.compile('[-a-zA-Z0-9 ._]+$').match
     _valid = re.compile(r'\${[-a-zA-Z0-9 ._]*:[-a-zA-Z0-9 ._]+}$').match
-    def _sub(self, template, seen):
-        value = self._template_split(template)
-        subs = []
-        for ref in value[1::2]:
-            s = tuple(ref[2:-1].split(':'))
-            if not self._valid(ref):
-                if len(s) < 2:
-                    raise zc.buildout.UserError("The substitution, %s,\n"
-                                                "doesn't contain a colon."
-                                                % ref)
-                if len(s) > 2:
-                    raise zc.buildout.UserError("The substitution, %s,\n"
-                                                "has too many colons."
-                                                % ref)
-                if not self._simple(s[0]):
-                    raise zc.buildout.UserError(
-                        "The section name in substitution, %s,\n"
-                        "has invalid characters."
-                        % ref)
-                if not self._simple(s[1]):
-                    raise zc.buildout.UserError(
-                        "The option name in substitution, %s,\n"
-                        "has invalid characters."
-                        % ref)
 
-            section, option = s
+    _compiled = {}
+    @classmethod
+    def _compile(cls, template):
+        """Split a template into literal text and references.
+
+        Returns a tuple of texts and a tuple of (section, option)
+        references, with one more text than references.  Templates are
+        only compiled once.
+        """
+        try:
+            return cls._compiled[template]
+        except KeyError:
+            pass
+
+        texts = ['']
+        refs = []
+        for i, part in enumerate(template.split('$$')):
+            if i:
+                texts[-1] += '$$'
+            value = cls._template_split(part)
+            texts[-1] += value[0]
+            for ref, text in zip(value[1::2], value[2::2]):
+                s = tuple(ref[2:-1].split(':'))
+                if not cls._valid(ref):
+                    if len(s) < 2:
+                        raise zc.buildout.UserError("The substitution, %s,\n"
+                                                    "doesn't contain a colon."
+                                                    % ref)
+                    if len(s) > 2:
+                        raise zc.buildout.UserError("The substitution, %s,\n"
+                                                    "has too many colons."
+                                                    % ref)
+                    if not cls._simple(s[0]):
+                        raise zc.buildout.UserError(
+                            "The section name in substitution, %s,\n"
+                            "has invalid characters."
+                            % ref)
+                    if not cls._simple(s[1]):
+                        raise zc.buildout.UserError(
+                            "The option name in substitution, %s,\n"
+                            "has invalid characters."
+                            % ref)
+                refs.append(s)
+                texts.append(text)
+
+        result = cls._compiled[template] = tuple(texts), tuple(refs)
+        return result
+
+    def _sub(self, template, seen):
+        texts, refs = self._compile(template)
+        result = [texts[0]]
+        for (section, option), text in zip(refs, texts[1:]):
             if not section:
                 section = self.name
             v = self.buildout[section].get(option, None, seen)
@@ -1710,10 +2530,10 @@ class Options(DictMixin):
                 else:
                     raise MissingOption("Referenced option does not exist:",
                                         section, option)
-            subs.append(v)
-        subs.append('')
+            result.append(v)
+            result.append(text)
 
-        return ''.join([''.join(v) for v in zip(value[::2], subs)])
+        return ''.join(result)
 
     def __getitem__(self, key):
         try:
@@ -1761,11 +2581,19 @@ class Options(DictMixin):
 
     def _call(self, f):
         buildout_directory = self.buildout['buildout']['directory']
+        # When parts are installed in threads, the current directory is
+        # set once for all of them, see Buildout._install_parts.
+        chdir = not self.buildout._installing_in_parallel
         self._created = []
         try:
             try:
-                os.chdir(buildout_directory)
-                return f()
+                if chdir:
+                    os.chdir(buildout_directory)
+                name = getattr(f, '__name__', 'call')
+                with _timed('%s %s' % (name.capitalize(), self.name),
+                            'part'):
+                    return _profiled(self.buildout,
+                                     '%s.%s' % (self.name, name), f)
             except Exception:
                 for p in self._created:
                     if os.path.isdir(p):
@@ -1777,7 +2605,8 @@ class Options(DictMixin):
                 raise
         finally:
             self._created = None
-            os.chdir(buildout_directory)
+            if chdir:
+                os.chdir(buildout_directory)
 
     def created(self, *paths):
         try:
@@ -1822,6 +2651,56 @@ def _quote_spacey_nl(match):
         )
     return result
 
+# The first line of installed journals.  Bump the version when their
+# format changes.
+_installed_journal_header = ['zc.buildout installed journal', 1]
+
+def _read_installed_journal(path):
+    """Read the sections recorded in an installed journal.
+
+    Returns the sections and whether the journal should be compacted,
+    or None if the file isn't a journal.
+    """
+    with open(path) as f:
+        try:
+            if json.loads(f.readline()) != _installed_journal_header:
+                return None
+        except ValueError:
+            return None
+
+        sections = {}
+        records = 0
+        compact = False
+        for line in f:
+            try:
+                record = json.loads(line)
+            except ValueError:
+                # A record that wasn't completely written.  Later records
+                # would be appended to it, so write the journal again.
+                compact = True
+                break
+            if record[0] == 'section':
+                sections[record[1]] = record[2]
+            else:
+                sections.setdefault('buildout', {}).update(record[1])
+            records += 1
+
+    return sections, compact or records > 2 * len(sections)
+
+def _write_installed_journal(path, records):
+    with zc.buildout.utils.atomic_write(path) as f:
+        f.write(json.dumps(_installed_journal_header) + '\n')
+        for record in records:
+            f.write(json.dumps(record) + '\n')
+
+def _append_installed_journal(path, records):
+    # Each record is written at once, so a record is either recorded
+    # completely or, if we're interrupted, is the last, incomplete one.
+    with open(path, 'a') as f:
+        for record in records:
+            f.write(json.dumps(record) + '\n')
+            f.flush()
+
 def _save_option(option, value, f):
     value = _spacey_nl.sub(_quote_spacey_nl, value)
     if value.startswith('\n\t'):
@@ -1837,6 +2716,7 @@ def _save_options(section, options, f):
     for option, value in items:
         _save_option(option, value, f)
 
+@lru_cache(maxsize=None)
 def _default_globals():
     """Return a mapping of default and precomputed expressions.
     These default expressions are convenience defaults available when eveluating
@@ -1844,7 +2724,8 @@ def _default_globals():
     NB: this is wrapped in a function so that the computing of these expressions
     is lazy and done only if needed (ie if there is at least one section with
     an expression) because the computing of some of these expressions can be
-    expensive.
+    expensive.  It's only done once per process, so expressions are
+    evaluated with copies of the mapping.
     """
     # partially derived or inspired from its.py
     # Copyright (c) 2012, Kenneth Reitz All rights reserved.
@@ -1919,16 +2800,51 @@ def _default_globals():
 
 variable_template_split = re.compile('([$]{[^}]*})').split
 
-def _open(
-        base, filename, seen, download_options,
-        override, downloaded, user_defaults
-        ):
-    """Open a configuration file and return the result as a dictionary,
+class _ExtendsPrefetcher(object):
+    """Download remote extends in the background.
 
-    Recursively open other files based on buildout options found.
+    As soon as a configuration file has been parsed, the URLs it extends
+    are handed to a thread pool, so that they, and in turn the files they
+    extend, download while earlier extends are still being processed.
+    Files are still opened and merged in the usual order.
     """
-    download_options = _update_section(download_options, override)
-    raw_download_options = _unannotate_section(download_options)
+
+    def __init__(self):
+        self.executor = None
+        self.futures = {}
+
+    def prefetch(self, workers, urls):
+        """Start downloading urls, a list of (url, download) pairs.
+        """
+        if workers < 2:
+            return
+        if self.executor is None:
+            self.executor = concurrent.futures.ThreadPoolExecutor(workers)
+        for url, download in urls:
+            if url not in self.futures:
+                self.futures[url] = self.executor.submit(download, url)
+
+    def download(self, download, url):
+        future = self.futures.pop(url, None)
+        if future is None:
+            return download(url)
+        return future.result()
+
+    def close(self):
+        if self.executor is None:
+            return
+        self.executor.shutdown(wait=True)
+        # Clean up downloads nobody asked for in the end, e.g. because
+        # an error occurred.
+        for future in self.futures.values():
+            if future.exception() is None:
+                path, is_temp = future.result()
+                if is_temp:
+                    os.remove(path)
+        self.futures.clear()
+
+
+def _extends_download(raw_download_options, filename, downloaded):
     newest = bool_option(raw_download_options, 'newest', 'false')
     fallback = newest and not (filename in downloaded)
     extends_cache = raw_download_options.get('extends-cache')
@@ -1937,58 +2853,127 @@ def _open(
             "extends-cache '%s' may not contain ${section:variable} to expand."
             % extends_cache
         )
-    download = zc.buildout.download.Download(
+    return zc.buildout.download.Download(
         raw_download_options, cache=extends_cache,
         fallback=fallback, hash_name=True)
-    is_temp = False
-    downloaded_filename = None
-    if _isurl(filename):
-        downloaded_filename, is_temp = download(filename)
-        fp = open(downloaded_filename)
-        base = filename[:filename.rfind('/')]
-    elif _isurl(base):
-        if os.path.isabs(filename):
-            fp = open(filename)
-            base = os.path.dirname(filename)
+
+
+def _prefetch_extends(
+        prefetcher, base, extends, download_options, override, downloaded,
+        parsed):
+    download_options = _update_section(download_options, override)
+    raw_download_options = _unannotate_section(download_options)
+    workers = _workers_option(raw_download_options, 'parallel-extends')
+    if workers < 2:
+        return
+
+    urls = []
+    for fname in extends:
+        if _isurl(fname):
+            url = fname
+        elif _isurl(base) and not os.path.isabs(fname):
+            url = base + '/' + fname
         else:
-            filename = base + '/' + filename
-            downloaded_filename, is_temp = download(filename)
-            fp = open(downloaded_filename)
-            base = filename[:filename.rfind('/')]
+            continue
+        if url in parsed:
+            continue
+        urls.append((url, _extends_download(
+            raw_download_options, fname, downloaded)))
+    prefetcher.prefetch(workers, urls)
+
+
+def _open(
+        base, filename, seen, download_options,
+        override, downloaded, user_defaults, missing=None, prefetcher=None,
+        parsed=None, full_history=True,
+        ):
+    """Open a configuration file and return the result as a dictionary,
+
+    Recursively open other files based on buildout options found.
+
+    The names of all files and URLs read are added to ``downloaded``.
+    Optional extends that don't exist are appended to ``missing``, if
+    given, as tuples of their absolute path and their name.
+    Remote extends are downloaded in parallel, using ``prefetcher``, when
+    the ``parallel-extends`` option is larger than 1.
+
+    Each file is parsed only once per ``parsed`` mapping, which maps file
+    names and URLs to their parsed data.
+
+    Unless ``full_history`` is true, the options read only keep their
+    history since their value was last set, see SectionKey.
+    """
+    if parsed is None:
+        parsed = {}
+    if prefetcher is None:
+        prefetcher = _ExtendsPrefetcher()
+        try:
+            return _open(base, filename, seen, download_options, override,
+                         downloaded, user_defaults, missing, prefetcher,
+                         parsed, full_history)
+        finally:
+            prefetcher.close()
+
+    download_options = _update_section(download_options, override)
+    raw_download_options = _unannotate_section(download_options)
+    download = _extends_download(raw_download_options, filename, downloaded)
+    if _isurl(filename):
+        remote = True
+    elif _isurl(base) and not os.path.isabs(filename):
+        filename = base + '/' + filename
+        remote = True
     else:
         filename = os.path.join(base, filename)
-        fp = open(filename)
+        remote = False
+    if remote:
+        base = filename[:filename.rfind('/')]
+    else:
         base = os.path.dirname(filename)
-    downloaded.add(filename)
 
     if filename in seen:
-        if is_temp:
-            fp.close()
-            os.remove(downloaded_filename)
         raise zc.buildout.UserError("Recursive file include", seen, filename)
 
-    root_config_file = not seen
-    seen.append(filename)
+    if filename in parsed:
+        # We've read this file before in this run, through another file
+        # extending it.  Merging doesn't modify the parsed data, so it
+        # can be shared.
+        result, extends, optional_extends = parsed[filename]
+    else:
+        is_temp = False
+        downloaded_filename = None
+        if remote:
+            downloaded_filename, is_temp = prefetcher.download(
+                download, filename)
+            fp = open(downloaded_filename)
+        else:
+            fp = open(filename)
 
-    filename_for_logging = filename
-    if downloaded_filename:
-        filename_for_logging = '%s (downloaded as %s)' % (
-            filename, downloaded_filename)
-    result = zc.buildout.configparser.parse(
-        fp, filename_for_logging, _default_globals)
+        filename_for_logging = filename
+        if downloaded_filename:
+            filename_for_logging = '%s (downloaded as %s)' % (
+                filename, downloaded_filename)
+        try:
+            result = zc.buildout.configparser.parse(
+                fp, filename_for_logging, _default_globals)
+        finally:
+            fp.close()
+            if is_temp:
+                os.remove(downloaded_filename)
 
-    fp.close()
-    if is_temp:
-        os.remove(downloaded_filename)
+        options = result.get('buildout', {})
+        extends = options.pop('extends', None)
+        optional_extends = options.pop('optional-extends', None)
+        if 'extended-by' in options:
+            raise zc.buildout.UserError(
+                'No-longer supported "extended-by" option found in %s.' %
+                filename)
 
-    options = result.get('buildout', {})
-    extends = options.pop('extends', None)
-    if 'extended-by' in options:
-        raise zc.buildout.UserError(
-            'No-longer supported "extended-by" option found in %s.' %
-            filename)
+        result = _annotate(result, filename, full_history)
+        parsed[filename] = result, extends, optional_extends
 
-    result = _annotate(result, filename)
+    downloaded.add(filename)
+    root_config_file = not seen
+    seen.append(filename)
 
     if root_config_file and 'buildout' in result:
         download_options = _update_section(
@@ -1999,26 +2984,32 @@ def _open(
     eresults = []
     if extends:
         extends = extends.split()
+        _prefetch_extends(
+            prefetcher, base, extends, download_options, override, downloaded,
+            parsed)
         for fname in extends:
             next_extend, user_defaults = _open(
                 base, fname, seen, download_options, override,
-                downloaded, user_defaults)
+                downloaded, user_defaults, missing, prefetcher, parsed,
+                full_history)
             eresults.extend(next_extend)
     else:
         if user_defaults:
             result = _update(user_defaults, result)
             user_defaults = {}
 
-    optional_extends = options.pop('optional-extends', None)
     if optional_extends:
-        optional_extends = optional_extends.value.split()
+        optional_extends = optional_extends.split()
         for fname in optional_extends:
             if not os.path.exists(fname):
                 print("optional-extends file not found: %s" % fname)
+                if missing is not None:
+                    missing.append((os.path.abspath(fname), fname))
                 continue
             next_extend, user_defaults = _open(
                 base, fname, seen, download_options, override,
-                downloaded, user_defaults)
+                downloaded, user_defaults, missing, prefetcher, parsed,
+                full_history)
             eresults.extend(next_extend)
 
     eresults.append(result)
@@ -2034,16 +3025,94 @@ def _open(
 
 
 ignore_directories = '.svn', 'CVS', '__pycache__', '.git'
+
+# Patterns of other file and directory names ignored by _dir_hash, see the
+# dir-hash-ignore option.
+_dir_hash_ignore = ()
+
+# The file recording the digests of the files hashed by _dir_hash, see the
+# dir-hash-cache option, the digests read from it, and the digests to
+# record, by path.  Digests are recorded with the size, modification time
+# and inode of the file, and only used while these are the same.
+_dir_hash_cache = None
+_file_digests = {}
+_file_digests_used = {}
+
+def _configure_dir_hash(cache=None, ignore=()):
+    global _dir_hash_cache, _dir_hash_ignore
+    _dir_hash_ignore = tuple(ignore)
+    _dir_hash_cache = cache
+    _dir_hashes.clear()
+    _file_digests.clear()
+    _file_digests_used.clear()
+    if cache:
+        try:
+            with open(cache) as f:
+                _file_digests.update(json.load(f))
+        except (OSError, ValueError):
+            pass
+
+def _save_dir_hash_cache():
+    if not _dir_hash_cache or _file_digests_used == _file_digests:
+        return
+    with zc.buildout.utils.atomic_write(_dir_hash_cache) as f:
+        json.dump(_file_digests_used, f)
+
+def _dir_hash_ignored(name):
+    return name in ignore_directories or any(
+        fnmatch.fnmatch(name, pattern) for pattern in _dir_hash_ignore)
+
+def _compute_file_digest(path, name):
+    hash = hashlib.blake2b(digest_size=16)
+    if name == 'entry_points.txt':
+        # Entry points aren't written in stable order. :(
+        try:
+            with open(path) as f:
+                sections = zc.buildout.configparser.parse(f, path)
+            hash.update(repr([(sname, sorted(sections[sname].items()))
+                              for sname in sorted(sections)]).encode('utf-8'))
+            return hash.hexdigest()
+        except Exception:
+            hash = hashlib.blake2b(digest_size=16)
+    with open(path, 'rb') as f:
+        while True:
+            data = f.read(1 << 20)
+            if not data:
+                break
+            hash.update(data)
+    return hash.hexdigest()
+
+def _file_digest(path, name):
+    st = os.stat(path)
+    key = [st.st_size, st.st_mtime_ns, st.st_ino]
+    cached = _file_digests.get(path)
+    if cached is not None and cached[:3] == key:
+        digest = cached[3]
+    else:
+        digest = _compute_file_digest(path, name)
+    # A file changed right after we read it could have the same
+    # modification time, so only record digests of files that didn't
+    # change recently.
+    if st.st_mtime_ns < time.time_ns() - 2000000000:
+        _file_digests_used[path] = key + [digest]
+    return digest
+
 _dir_hashes = {}
 def _dir_hash(dir):
+    """Return a digest of the names and contents of the files in dir.
+
+    Files are only read if they weren't read before, in this process or,
+    with a dir-hash-cache, in an earlier one, or they changed since.
+    """
     dir_hash = _dir_hashes.get(dir, None)
     if dir_hash is not None:
         return dir_hash
-    hash = md5()
+    hash = hashlib.blake2b(digest_size=16)
     for (dirpath, dirnames, filenames) in os.walk(dir):
-        dirnames[:] = sorted(n for n in dirnames if n not in ignore_directories)
+        dirnames[:] = sorted(n for n in dirnames if not _dir_hash_ignored(n))
         filenames[:] = sorted(f for f in filenames
                               if (not (f.endswith('pyc') or f.endswith('pyo'))
+                                  and not _dir_hash_ignored(f)
                                   and os.path.exists(os.path.join(dirpath, f)))
                           )
         for_hash = ' '.join(dirnames + filenames)
@@ -2052,25 +3121,108 @@ def _dir_hash(dir):
         hash.update(for_hash)
         for name in filenames:
             path = os.path.join(dirpath, name)
-            if name == 'entry_points.txt':
-                f = open(path)
-                # Entry points aren't written in stable order. :(
-                try:
-                    sections = zc.buildout.configparser.parse(f, path)
-                    data = repr([(sname, sorted(sections[sname].items()))
-                                 for sname in sorted(sections)]).encode('utf-8')
-                except Exception:
-                    f.close()
-                    f = open(path, 'rb')
-                    data = f.read()
-            else:
-                f = open(path, 'rb')
-                data = f.read()
-            f.close()
-            hash.update(data)
+            hash.update(_file_digest(path, name).encode())
     _dir_hashes[dir] = dir_hash = hash.hexdigest()
     return dir_hash
 
+def _develop_fingerprint(setup):
+    """Return a digest of the files used to make an editable install.
+
+    Other files don't matter, as the install refers to the sources.
+    """
+    if os.path.isdir(setup):
+        directory = setup
+    else:
+        directory = os.path.dirname(setup)
+    hash = md5(sys.executable.encode())
+    paths = [os.path.join(directory, name)
+             for name in ('setup.py', 'setup.cfg', 'pyproject.toml')]
+    paths.extend(sorted(
+        glob.glob(os.path.join(directory, '*.egg-info', 'entry_points.txt'))
+        + glob.glob(os.path.join(directory, 'src', '*.egg-info',
+                                 'entry_points.txt'))))
+    for path in paths:
+        hash.update(path.encode())
+        try:
+            with open(path, 'rb') as f:
+                hash.update(f.read())
+        except OSError:
+            hash.update(b'-')
+    return hash.hexdigest()
+
+def _dir_state(dir):
+    """Return a digest of the names, sizes and times of files in a directory.
+
+    This is much cheaper than _dir_hash, as files aren't read.
+    """
+    hash = md5()
+    for (dirpath, dirnames, filenames) in os.walk(dir):
+        dirnames[:] = sorted(n for n in dirnames if n not in ignore_directories)
+        for name in sorted(filenames):
+            if name.endswith('pyc') or name.endswith('pyo'):
+                continue
+            try:
+                st = os.stat(os.path.join(dirpath, name))
+            except OSError:
+                continue
+            hash.update(repr((os.path.join(dirpath, name), st.st_size,
+                              st.st_mtime_ns)).encode())
+    return hash.hexdigest()
+
+def _installed_files_exist(paths, workers=1):
+    """Return whether all of the paths exist.
+
+    Paths are grouped by directory.  Directories containing several of
+    the paths are listed with os.scandir, rather than checking each
+    path, and up to workers directories are checked at the same time.
+    """
+    directories = {}
+    for path in paths:
+        directory, name = os.path.split(os.path.normpath(path))
+        directories.setdefault(directory, []).append(name)
+
+    def check(item):
+        directory, names = item
+        if len(names) == 1:
+            return os.path.exists(os.path.join(directory, names[0]))
+        try:
+            with os.scandir(directory) as entries:
+                found = dict((entry.name, entry) for entry in entries)
+        except OSError:
+            return False
+        for name in names:
+            entry = found.get(name)
+            if entry is None:
+                return False
+            if entry.is_symlink() and not os.path.exists(entry.path):
+                return False
+        return True
+
+    if workers < 2 or len(directories) < 2:
+        return all(map(check, directories.items()))
+    with concurrent.futures.ThreadPoolExecutor(workers) as executor:
+        return all(executor.map(check, directories.items()))
+
+def _installed_manifest(paths):
+    """Return a digest of the directories containing paths.
+
+    Removing a file changes its directory, so if the digest didn't
+    change, the files are still there.  Returns None if a directory
+    doesn't exist or changed too recently to tell.
+    """
+    hash = md5()
+    recent = time.time_ns() - 2000000000
+    for directory in sorted(set(os.path.dirname(os.path.normpath(path))
+                                for path in paths)):
+        try:
+            st = os.stat(directory)
+        except OSError:
+            return None
+        if st.st_mtime_ns >= recent:
+            return None
+        hash.update(repr((directory, st.st_ino, st.st_mtime_ns)).encode())
+    return hash.hexdigest()
+
 def _dists_sig(dists):
     seen = set()
     result = []
@@ -2086,29 +3238,31 @@ def _dists_sig(dists):
     return result
 
 def _update_section(in1, s2):
-    s1 = copy.deepcopy(in1)
+    s1 = dict(in1)
     # Base section 2 on section 1; section 1 is copied, with key-value pairs
     # in section 2 overriding those in section 1. If there are += or -=
     # operators in section 2, process these to add or subtract items (delimited
     # by newlines) from the preexisting values.
-    s2 = copy.deepcopy(s2) # avoid mutating the second argument, which is unexpected
+    s2 = dict(s2) # avoid mutating the second argument, which is unexpected
     # Sort on key, then on the addition or subtraction operator (+ comes first)
     for k, v in sorted(s2.items(), key=lambda x: (x[0].rstrip(' +'), x[0][-1])):
         if k.endswith('+'):
             key = k.rstrip(' +')
-            implicit_value = SectionKey("", "IMPLICIT_VALUE")
+            implicit_value = SectionKey("", "IMPLICIT_VALUE",
+                                        v.full_history)
             # Find v1 in s2 first; it may have been defined locally too.
             section_key = s2.get(key, s1.get(key, implicit_value))
-            section_key = copy.deepcopy(section_key)
+            section_key = section_key.copy()
             section_key.addToValue(v.value, v.source)
             s2[key] = section_key
             del s2[k]
         elif k.endswith('-'):
             key = k.rstrip(' -')
-            implicit_value = SectionKey("", "IMPLICIT_VALUE")
+            implicit_value = SectionKey("", "IMPLICIT_VALUE",
+                                        v.full_history)
             # Find v1 in s2 first; it may have been set by a += operation first
             section_key = s2.get(key, s1.get(key, implicit_value))
-            section_key = copy.deepcopy(section_key)
+            section_key = section_key.copy()
             section_key.removeFromValue(v.value, v.source)
             s2[key] = section_key
             del s2[k]
@@ -2119,13 +3273,14 @@ def _update_section(in1, s2):
 def _update_verbose(s1, s2):
     for key, v2 in s2.items():
         if key in s1:
-            v1 = s1[key]
+            v1 = s1[key] = s1[key].copy()
             v1.overrideValue(v2)
         else:
-            s1[key] = copy.deepcopy(v2)
+            s1[key] = v2
 
 def _update(in1, d2):
-    d1 = copy.deepcopy(in1)
+    # Section keys are copied when they're changed, see SectionKey.
+    d1 = {section: dict(options) for section, options in in1.items()}
     for section in d2:
         if section in d1:
             d1[section] = _update_section(d1[section], d2[section])
@@ -2133,7 +3288,7 @@ def _update(in1, d2):
             # Skip sections that extend in other sections (macros), as we don't
             # have all the data (these will be processed when the section is
             # extended)
-            temp = copy.deepcopy(d2[section])
+            temp = dict(d2[section])
             # 641 - Process base definitions done with += and -=
             for k, v in sorted(temp.items(), key=lambda item: item[0]):
                 # Process + before -, configparser resolves conflicts
@@ -2143,7 +3298,7 @@ def _update(in1, d2):
                     del temp[k]
                 elif k[-1] == '-' and k[:-2] not in temp:
                     # Turn -= without a preceding = into an empty assignment
-                    temp[k[:-2]] = temp[k]
+                    temp[k[:-2]] = temp[k].copy()
                     temp[k[:-2]].removeFromValue(
                         temp[k[:-2]].value, "IMPLICIT_VALUE"
                         )
@@ -2153,7 +3308,7 @@ def _update(in1, d2):
             # in the same file, which can happen with conditional sections
             d1[section] = _update_section({}, temp)
         else:
-            d1[section] = copy.deepcopy(d2[section])
+            d1[section] = dict(d2[section])
 
     return d1
 
@@ -2187,15 +3342,111 @@ def _error(*message):
     sys.stderr.write('Error: ' + ' '.join(message) +'\n')
     sys.exit(1)
 
+class _Profile(object):
+    """Wall and CPU times of the phases of a run and of each part.
+    """
+
+    def __init__(self):
+        self.start = time.perf_counter()
+        self.events = []
+
+    @contextlib.contextmanager
+    def __call__(self, name, category):
+        wall = time.perf_counter()
+        # Parts may be installed in threads, so use the CPU time of the
+        # thread.  This doesn't include the CPU time of subprocesses.
+        cpu = time.thread_time()
+        try:
+            yield
+        finally:
+            self.events.append(dict(
+                name=name, cat=category, ph='X', pid=os.getpid(),
+                tid=threading.get_ident(),
+                ts=round((wall - self.start) * 1000000),
+                dur=round((time.perf_counter() - wall) * 1000000),
+                args=dict(cpu=round((time.thread_time() - cpu) * 1000000)),
+                ))
+
+    def report(self):
+        print_('Profile:')
+        print_('%10s %10s  %s' % ('Wall', 'CPU', 'Phase or part'))
+        for event in sorted(self.events, key=lambda e: -e['dur']):
+            print_('%9.3fs %9.3fs  %s' % (
+                event['dur'] / 1000000, event['args']['cpu'] / 1000000,
+                event['name']))
+
+    def save(self, path):
+        """Save a trace in the Chrome trace event format.
+        """
+        with open(path, 'w') as f:
+            json.dump(dict(traceEvents=self.events, displayTimeUnit='ms'),
+                      f, indent=1)
+
+_profile = None
+_not_timed = contextlib.nullcontext()
+
+def _timed(name, category='phase'):
+    """Return a context manager recording how long something took.
+
+    Nothing is recorded unless buildout was run with --profile.
+    """
+    if _profile is None:
+        return _not_timed
+    return _profile(name, category)
+
+# cProfile can't profile several calls at once, so profiled calls are
+# made one at a time.
+_profiled_lock = threading.RLock()
+_profiling = False
+_unsafe_file_name_chars = re.compile(r'[^\w.-]')
+
+def _profiled(buildout, name, f, *args):
+    """Call f, saving a profile of the call if recipes are profiled.
+
+    With the profile-recipes option, the profile is saved in name.pstats
+    in the profile-recipes-directory, with characters that aren't safe in
+    file names, like /, replaced by underscores.  Failing to save
+    it is logged, rather than replacing what f raised.
+    """
+    directory = buildout._profile_recipes
+    if not directory:
+        return f(*args)
+
+    global _profiling
+    with _profiled_lock:
+        if _profiling:
+            # f was called by a call we're already profiling.
+            return f(*args)
+        _profiling = True
+        profile = cProfile.Profile()
+        try:
+            return profile.runcall(f, *args)
+        finally:
+            _profiling = False
+            path = os.path.join(
+                directory, _unsafe_file_name_chars.sub('_', name) + '.pstats')
+            try:
+                if not os.path.exists(directory):
+                    os.makedirs(directory)
+                profile.dump_stats(path)
+            except OSError as e:
+                buildout._logger.warning(
+                    "Couldn't save the profile of %s: %s", name, e)
+
 _internal_error_template = """
 An internal error occurred due to a bug in either zc.buildout or in a
 recipe being used:
 """
 
-def _check_for_unused_options_in_section(buildout, section):
-    options = buildout[section]
-    unused = [option for option in sorted(options._raw)
-              if option not in options._data]
+def _unused_options(options, names=None):
+    """Return the options that weren't used, among names if given."""
+    if names is None:
+        names = options._raw
+    return [option for option in sorted(names)
+            if option not in options._data]
+
+def _check_for_unused_options_in_section(buildout, section, names=None):
+    unused = _unused_options(buildout[section], names)
     if unused:
         buildout._logger.warning(
             "Section `%s` contains unused option(s): %s.\n"
@@ -2252,6 +3503,12 @@ Options:
 
     Print buildout version number and exit.
 
+  --profile[=trace_file]
+
+    Record the wall and CPU time of each phase of the run and of each
+    part, print a summary sorted by wall time, and save a trace in the
+    Chrome trace event format, by default in buildout-profile.json.
+
 Assignments are of the form: section:option=value and are used to
 provide configuration options that override those given in the
 configuration file.  For example, to run the buildout in offline mode,
@@ -2303,6 +3560,12 @@ Commands:
   query section:key
 
     Display value of given section key pair.
+
+  cache-prune
+
+    Remove the least recently used files from the download and extends
+    caches, until they are no larger than the download-cache-max-size
+    and extends-cache-max-size options allow.
 """
 
 def _help():
@@ -2324,6 +3587,7 @@ def main(args=None):
     options = []
     use_user_defaults = True
     debug = False
+    profile = None
     while args:
         if args[0][0] == '-':
             op = orig_op = args.pop(0)
@@ -2376,6 +3640,13 @@ def main(args=None):
                     _help()
                 elif orig_op == '--version':
                     _version()
+                elif orig_op == '--profile':
+                    profile = 'buildout-profile.json'
+                elif orig_op.startswith('--profile='):
+                    profile = orig_op[10:]
+                    if not profile:
+                        _error("No file name specified for option",
+                               '--profile')
                 else:
                     _error("Invalid option", '-'+op[0])
         elif '=' in args[0]:
@@ -2397,16 +3668,25 @@ def main(args=None):
 
     if args:
         command = args.pop(0)
-        if command not in Buildout.COMMANDS:
+        if command.replace('-', '_') not in Buildout.COMMANDS:
             _error('invalid command:', command)
+        # Commands are methods, with underscores instead of dashes.
+        command = command.replace('-', '_')
     else:
         command = 'install'
 
+    global _profile
+    if profile:
+        profile = os.path.abspath(profile)
+        _profile = _Profile()
+
     try:
         try:
-            buildout = Buildout(config_file, options,
-                                use_user_defaults, command, args)
-            getattr(buildout, command)(args)
+            with _timed('Loading configuration'):
+                buildout = Buildout(config_file, options,
+                                    use_user_defaults, command, args)
+            with _timed(command.capitalize(), 'command'):
+                getattr(buildout, command)(args)
         except SystemExit:
             logging.shutdown()
             # Make sure we properly propagate an exit code from a restarted
@@ -2433,9 +3713,40 @@ def main(args=None):
             sys.exit(1)
 
     finally:
+        if _profile is not None:
+            _profile.report()
+            _profile.save(profile)
+            _profile = None
         logging.shutdown()
 
 
+_size_units = dict(k=1 << 10, m=1 << 20, g=1 << 30, t=1 << 40)
+_size_match = re.compile(r'(\d+(?:\.\d*)?)\s*([kmgt]?)b?$', re.I).match
+def _size_option(options, name):
+    """Return the size in bytes an option is set to, or None if it isn't set.
+
+    Sizes are numbers of bytes, optionally with a K, M, G or T suffix for
+    kibibytes, mebibytes, gibibytes or tebibytes.
+    """
+    value = options.get(name, '').strip()
+    if not value:
+        return None
+    match = _size_match(value)
+    if match is None:
+        raise zc.buildout.UserError(
+            'Invalid value for %r option: %r' % (name, value))
+    number, unit = match.groups()
+    return int(float(number) * _size_units.get(unit.lower(), 1))
+
+def _workers_option(options, name):
+    """Return the number of workers an option is set to, 1 by default."""
+    value = options.get(name, '').strip() or '1'
+    try:
+        return int(value)
+    except ValueError:
+        raise zc.buildout.UserError(
+            "Invalid value for %s option: %s" % (name, value))
+
 _bool_names = {'true': True, 'false': False, True: True, False: False}
 def bool_option(options, name, default=None):
     value = options.get(name, default)
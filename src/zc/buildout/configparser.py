@@ -17,9 +17,9 @@
 # - Both strip option values in undesirable ways
 # - dict of dicts is a much simpler api
 
-import re
-import textwrap
 import logging
+import os
+import re
 
 from packaging import markers
 
@@ -116,7 +116,52 @@ option_start = re.compile(
     r'='
     r'(?P<value>.*)$').match
 
-leading_blank_lines = re.compile(r"^(\s*\n)+")
+# The part of option lines before the =, see option_start.
+option_name = re.compile(r'[^\s{}[\]=:]+\s*[-+]?').fullmatch
+
+# Results of markers in section expressions, by expression.  They only
+# depend on the Python interpreter, and the same conditions tend to be used
+# in many sections and files.
+_marker_conditions = {}
+
+def _evaluate_condition(head, expression, tail, exp_globals, conditions):
+    """Return the result of a section expression.
+
+    The results of old-style Python expressions, which can depend on
+    anything, are only remembered in conditions, which the caller keeps
+    for one file.
+    """
+    key = expression, tail
+    try:
+        return conditions[key]
+    except KeyError:
+        pass
+
+    # normalize tail comments to Python style
+    tail = tail.replace(';', '#') if tail else ''
+    # un-escape literal # and ; . Do not use a
+    # string-escape decode
+    expr = expression.replace(r'\x23','#').replace(r'\x3b', ';')
+    try:
+        section_condition = _marker_conditions[expr]
+    except KeyError:
+        try:
+            # new-style markers as used in pip constraints, e.g.:
+            # 'python_version < "3.11" and platform_system == "Windows"'
+            marker = Marker(expr)
+        except InvalidMarker:
+            # old style buildout expression
+            # rebuild a valid Python expression wrapped in a list
+            expr = head + expr + tail
+            # evaluated expression is in list: get first element.  The
+            # expression gets its own copy of the globals, so it can't
+            # change them for others.
+            section_condition = eval(expr, dict(exp_globals()))[0]
+        else:
+            section_condition = _marker_conditions[expr] = marker.evaluate()
+
+    conditions[key] = section_condition
+    return section_condition
 
 def parse(fp, fpname, exp_globals=dict):
     """Parse a sectioned setup file.
@@ -139,26 +184,47 @@ def parse(fp, fpname, exp_globals=dict):
     exp_globals is a callable returning a mapping of defaults used as globals
     during the evaluation of a section conditional expression.
     """
+    # Read the whole file at once.  Lines don't keep their newlines, see
+    # _with_newline for error messages.
+    lines = fp.read().split('\n')
+    if not lines[-1]:
+        lines.pop()
+        last_newline = True
+    else:
+        last_newline = False
+
+    # While parsing, the values of options with continuation lines are
+    # lists of lines, to be joined at the end.  Other values are strings,
+    # as lots of small lists would keep the garbage collector busy.  Lines
+    # of values never end with whitespace.
     sections = {}
+    # results of section expressions in this file, see _evaluate_condition
+    conditions = {}
     # the current section condition, possibly updated from a section expression
     section_condition = True
-    context = None
     cursect = None                            # None, or a dictionary
+    # whether the current section has +=/-= options, and the sections that do
+    cursect_extended = False
+    extended = set()
     blockmode = None
     optname = None
-    lineno = 0
     e = None                                  # None, or an exception
-    while True:
-        line = fp.readline()
+    for lineno, line in enumerate(lines, 1):
         if not line:
-            break # EOF
-
-        lineno = lineno + 1
-
-        if line[0] in '#;':
+            # blank line, only kept in values starting on the next line
+            if blockmode and optname and section_condition and (
+                    cursect is not None):
+                value = cursect[optname]
+                if isinstance(value, str):
+                    cursect[optname] = value = [value]
+                value.append('')
+            continue
+
+        first = line[0]
+        if first in '#;':
             continue # comment
 
-        if line[0].isspace() and cursect is not None and optname:
+        if first.isspace() and cursect is not None and optname:
             if not section_condition:
                 #skip section based on its expression condition
                 continue
@@ -169,112 +235,152 @@ def parse(fp, fpname, exp_globals=dict):
                 line = line.strip()
                 if not line:
                     continue
-            cursect[optname] = "%s\n%s" % (cursect[optname], line)
-        else:
-            header = section_header(line)
-            if header:
-                # reset to True when starting a new section
-                section_condition = True
-                sectname = header.group('name')
-
-                head = header.group('head') # the starting [
-                expression = header.group('expression')
-                tail = header.group('tail') # closing ]and comment
-                if expression:
-                    # normalize tail comments to Python style
-                    tail = tail.replace(';', '#') if tail else ''
-                    # un-escape literal # and ; . Do not use a
-                    # string-escape decode
-                    expr = expression.replace(r'\x23','#').replace(r'\x3b', ';')
-                    try:
-                        # new-style markers as used in pip constraints, e.g.:
-                        # 'python_version < "3.11" and platform_system == "Windows"'
-                        marker = Marker(expr)
-                        section_condition = marker.evaluate()
-                    except InvalidMarker:
-                        # old style buildout expression
-                        # rebuild a valid Python expression wrapped in a list
-                        expr = head + expr + tail
-                        # lazily populate context only expression
-                        if not context:
-                            context = exp_globals()
-                        # evaluated expression is in list: get first element
-                        section_condition = eval(expr, context)[0]
-                    # finally, ignore section when an expression
-                    # evaluates to false
-                    if not section_condition:
-                        logger.debug(
-                            'Ignoring section %(sectname)r with [expression]:'
-                            ' %(expression)r' % locals())
-                        continue
-
-                if sectname in sections:
-                    cursect = sections[sectname]
-                else:
-                    sections[sectname] = cursect = {}
-                # So sections can't start with a continuation line
-                optname = None
-            elif cursect is None:
-                if not line.strip():
+            value = cursect[optname]
+            if isinstance(value, str):
+                cursect[optname] = value = [value]
+            value.append(line)
+            continue
+
+        # Only lines starting with [ can be section headers.
+        header = first == '[' and section_header(line)
+        if header:
+            # reset to True when starting a new section
+            section_condition = True
+            sectname = header.group('name')
+
+            head = header.group('head') # the starting [
+            expression = header.group('expression')
+            tail = header.group('tail') # closing ]and comment
+            if expression:
+                section_condition = _evaluate_condition(
+                    head, expression, tail, exp_globals, conditions)
+                # finally, ignore section when an expression
+                # evaluates to false
+                if not section_condition:
+                    logger.debug(
+                        'Ignoring section %(sectname)r with [expression]:'
+                        ' %(expression)r' % locals())
                     continue
-                # no section header in the file?
-                raise MissingSectionHeaderError(fpname, lineno, line)
+
+            if sectname in sections:
+                cursect = sections[sectname]
             else:
-                if line[:2] == '=>':
-                    line = '<part-dependencies> = ' + line[2:]
-                mo = option_start(line)
-                if mo:
-                    if not section_condition:
-                        # filter out options of conditionally ignored section
-                        continue
-                    # option start line
-                    optname, optval = mo.group('name', 'value')
-                    optname = optname.rstrip()
-                    optval = optval.strip()
-                    # Handle multiple extensions of the same value in the
-                    # same file. This happens with conditional sections.
-                    opt_op = optname[-1]
-                    if opt_op not in '+-':
-                        opt_op = '='
-                    if optname in cursect and opt_op in '+-':
-                        # Strip any trailing \n, which happens when we have multiple
-                        # +=/-= in one file
-                        cursect[optname] = cursect[optname].rstrip()
-                        if optval:
-                            cursect[optname] = "%s\n%s" % (cursect[optname], optval)
-                    else:
-                        # If an assignment (=) comes after an extend (+=) /
-                        # remove (-=), it overrides and replaces the preceding
-                        # extend / remove
-                        if opt_op == '=':
-                            for suffix in '+-':
-                                tempname = "%s %s" % (optname, suffix)
-                                if tempname in cursect:
-                                    del cursect[tempname]
-                        cursect[optname] = optval
-                    blockmode = not optval
-                elif not (optname or line.strip()):
-                    # blank line after section start
-                    continue
+                sections[sectname] = cursect = {}
+            cursect_extended = sectname in extended
+            # So sections can't start with a continuation line
+            optname = None
+            continue
+
+        if cursect is None:
+            if not line.strip():
+                continue
+            # no section header in the file?
+            raise MissingSectionHeaderError(
+                fpname, lineno,
+                _with_newline(line, lineno, len(lines), last_newline))
+
+        if first == '=' and line[:2] == '=>':
+            line = '<part-dependencies> = ' + line[2:]
+        name, equals, optval = line.partition('=')
+        if equals and option_name(name):
+            if not section_condition:
+                # filter out options of conditionally ignored section
+                continue
+            # option start line
+            optname = name.rstrip()
+            optval = optval.strip()
+            # Handle multiple extensions of the same value in the
+            # same file. This happens with conditional sections.
+            opt_op = optname[-1]
+            if opt_op not in '+-':
+                opt_op = '='
+            if opt_op != '=':
+                cursect_extended = True
+                extended.add(sectname)
+                if optname in cursect:
+                    # Strip any trailing \n, which happens when we have
+                    # multiple +=/-= in one file
+                    value = cursect[optname]
+                    if isinstance(value, list):
+                        value = '\n'.join(value)
+                    value = value.rstrip().split('\n')
+                    if optval:
+                        value.append(optval)
+                    cursect[optname] = value
                 else:
-                    # a non-fatal parsing error occurred.  set up the
-                    # exception but keep going. the exception will be
-                    # raised at the end of the file and will contain a
-                    # list of all bogus lines
-                    if not e:
-                        e = ParsingError(fpname)
-                    e.append(lineno, repr(line))
+                    cursect[optname] = optval
+            else:
+                # If an assignment (=) comes after an extend (+=) /
+                # remove (-=), it overrides and replaces the preceding
+                # extend / remove
+                if cursect_extended:
+                    for suffix in '+-':
+                        tempname = "%s %s" % (optname, suffix)
+                        if tempname in cursect:
+                            del cursect[tempname]
+                cursect[optname] = optval
+            blockmode = not optval
+        elif not (optname or line.strip()):
+            # blank line after section start
+            continue
+        else:
+            # a non-fatal parsing error occurred.  set up the
+            # exception but keep going. the exception will be
+            # raised at the end of the file and will contain a
+            # list of all bogus lines
+            if not e:
+                e = ParsingError(fpname)
+            e.append(lineno, repr(
+                _with_newline(line, lineno, len(lines), last_newline)))
 
     # if any parsing errors occurred, raise an exception
     if e:
         raise e
 
-    for sectname in sections:
-        section = sections[sectname]
-        for name in section:
-            value = section[name]
-            if value[:1].isspace():
-                section[name] = leading_blank_lines.sub(
-                    '', textwrap.dedent(value.rstrip()))
+    for section in sections.values():
+        for name, value in section.items():
+            if isinstance(value, str):
+                continue
+            if value[0] or len(value) == 1:
+                section[name] = '\n'.join(value)
+            else:
+                section[name] = _dedent(value)
 
     return sections
+
+
+def _with_newline(line, lineno, nlines, last_newline):
+    """Return a line as it was in the file, for error messages."""
+    if lineno < nlines or last_newline:
+        return line + '\n'
+    return line
+
+def _dedent(lines):
+    """Join the lines of a value, without their common indentation.
+
+    Leading and trailing blank lines are removed too, as textwrap.dedent
+    and a regular expression used to, in one pass over the lines, which
+    never end with whitespace, so blank lines are empty.
+    """
+    start = 0
+    end = len(lines)
+    while start < end and not lines[start]:
+        start += 1
+    while end > start and not lines[end - 1]:
+        end -= 1
+    lines = lines[start:end]
+    margin = None
+    for line in lines:
+        if not line:
+            continue
+        indent = line[:len(line) - len(line.lstrip(' \t'))]
+        if margin is None:
+            margin = indent
+        elif not indent.startswith(margin):
+            margin = os.path.commonprefix((margin, indent))
+        if not margin:
+            return '\n'.join(lines)
+    if margin is None:
+        return ''
+    width = len(margin)
+    return '\n'.join([line[width:] for line in lines])
@@ -14,10 +14,13 @@
 """Buildout download infrastructure"""
 
 from hashlib import md5
+from hashlib import sha256
 from urllib.request import urlretrieve
 from urllib.parse import urlparse
 from zc.buildout.easy_install import realpath
+from zc.buildout.utils import atomic_write
 
+import concurrent.futures
 import logging
 import os
 import os.path
@@ -25,19 +28,38 @@ import re
 import shutil
 import sys
 import tempfile
+import threading
+import time
 import zc.buildout
 
 
 class ChecksumError(zc.buildout.UserError):
     pass
 
+class BatchDownloadError(zc.buildout.UserError):
+    """Some of the files given to Download.download_many failed.
+
+    errors: a list of (URL, exception) tuples, in the order of the URLs
+    results: the results of the downloads, with None for failed ones
+
+    """
+
+    def __init__(self, errors, results):
+        self.errors = errors
+        self.results = results
+        super().__init__(
+            "Couldn't download %s of %s files:\n%s" % (
+                len(errors), len(results),
+                '\n'.join('  %s: %s' % (url, e) for (url, e) in errors)))
+
 class Download(object):
     """Configurable download utility.
 
     Handles the download cache and offline mode.
 
     Download(options=None, cache=None, namespace=None,
-             offline=False, fallback=False, hash_name=False, logger=None)
+             offline=False, fallback=False, hash_name=False, logger=None,
+             dedupe=False)
 
     options: mapping of buildout options (e.g. a ``buildout`` config section)
     cache: path to the download cache (excluding namespaces)
@@ -46,11 +68,14 @@ class Download(object):
     fallback: whether to use the cache as a fallback (try downloading first)
     hash_name: whether to use a hash of the URL as cache file name
     logger: an optional logger to receive download-related log messages
+    dedupe: whether to keep a single copy of files with the same content in
+            the cache, and find files by the checksums of their content
 
     """
 
     def __init__(self, options=None, cache=-1, namespace=None,
-                 offline=-1, fallback=False, hash_name=False, logger=None):
+                 offline=-1, fallback=False, hash_name=False, logger=None,
+                 dedupe=-1):
         if options is None:
             options = {}
         self.directory = options.get('directory', '')
@@ -65,6 +90,9 @@ class Download(object):
         self.fallback = fallback
         self.hash_name = hash_name
         self.logger = logger or logging.getLogger('zc.buildout')
+        self.dedupe = dedupe
+        if dedupe == -1:
+            self.dedupe = options.get('download-cache-dedupe') == 'true'
 
     @property
     def download_cache(self):
@@ -76,6 +104,18 @@ class Download(object):
         if self.download_cache is not None:
             return os.path.join(self.download_cache, self.namespace or '')
 
+    @property
+    def content_dir(self):
+        """The directory storing the files in the cache by content.
+
+        Files are stored under the SHA-256 checksum of their content, and
+        the files in the cache are hard links to them.  The index
+        subdirectory maps URLs and MD5 checksums to SHA-256 checksums.
+
+        """
+        if self.download_cache is not None:
+            return os.path.join(self.download_cache, '.content')
+
     def __call__(self, url, md5sum=None, path=None):
         """Download a file according to the utility's configuration.
 
@@ -93,6 +133,58 @@ class Download(object):
 
         return locate_at(local_path, path), is_temp
 
+    def download_many(self, urls, workers=4):
+        """Download several files at once, like calling the utility for each.
+
+        urls: URLs, or tuples of a URL and, optionally, an MD5 checksum to
+              match and a path where to place the downloaded file
+        workers: the maximum number of files to download at the same time
+
+        Returns a list of (path, is_temp) tuples, in the order of the URLs.
+        If any downloads fail, the others are still completed, and then a
+        BatchDownloadError exception listing the failures is raised.
+
+        """
+        requests = [(url, ) if isinstance(url, str) else tuple(url)
+                    for url in urls]
+
+        # Files that would end up at the same place, in the cache or at the
+        # given path, are downloaded one after the other, in order, as if
+        # they were downloaded one at a time.
+        groups = {}
+        for index, request in enumerate(requests):
+            if self.cache:
+                key = self.filename(request[0])
+            elif len(request) > 2 and request[2]:
+                key = realpath(request[2])
+            else:
+                key = index
+            groups.setdefault(key, []).append(index)
+
+        results = [None] * len(requests)
+        errors = {}
+
+        def download_group(indexes):
+            for index in indexes:
+                try:
+                    results[index] = self(*requests[index])
+                except Exception as e:
+                    errors[index] = e
+
+        if workers < 2 or len(groups) < 2:
+            for indexes in groups.values():
+                download_group(indexes)
+        else:
+            with concurrent.futures.ThreadPoolExecutor(workers) as executor:
+                list(executor.map(download_group, groups.values()))
+
+        if errors:
+            raise BatchDownloadError(
+                [(requests[index][0], errors[index])
+                 for index in sorted(errors)],
+                results)
+        return results
+
     def download_cached(self, url, md5sum=None):
         """Download a file from a URL using the cache.
 
@@ -109,7 +201,11 @@ class Download(object):
                 % self.download_cache)
         cache_dir = self.cache_dir
         if not os.path.exists(cache_dir):
-            os.mkdir(cache_dir)
+            try:
+                os.mkdir(cache_dir)
+            except FileExistsError:
+                # Created by a download in another thread.
+                pass
         cache_key = self.filename(url)
         cached_path = os.path.join(cache_dir, cache_key)
 
@@ -123,19 +219,86 @@ class Download(object):
                     raise
                 except Exception:
                     pass
+                else:
+                    if self.dedupe:
+                        self.store(url, md5sum, cached_path)
 
             if not check_md5sum(cached_path, md5sum):
                 raise ChecksumError(
                     'MD5 checksum mismatch for cached download '
                     'from %r at %r' % (url, cached_path))
             self.logger.debug('Using cache file %s' % cached_path)
+        elif self.dedupe and self.link_stored(url, md5sum, cached_path):
+            is_temp = False
         else:
             self.logger.debug('Cache miss; will cache %s as %s' %
                               (url, cached_path))
             _, is_temp = self.download(url, md5sum, cached_path)
+            if self.dedupe:
+                self.store(url, md5sum, cached_path)
 
+        record_use(cached_path)
         return cached_path, is_temp
 
+    def _index_keys(self, url, md5sum):
+        keys = ['url:' + url]
+        if md5sum:
+            keys.append('md5:' + md5sum)
+        return [os.path.join(self.content_dir, 'index',
+                             sha256(key.encode()).hexdigest())
+                for key in keys]
+
+    def link_stored(self, url, md5sum, path):
+        """Place a stored file with the content of a URL at a path.
+
+        The file is found by URL, or by MD5 checksum, if one is given, so
+        files downloaded from mirrors or renamed URLs are found too.
+
+        Returns whether a stored file was found.
+
+        """
+        for index_path in self._index_keys(url, md5sum):
+            try:
+                with open(index_path) as f:
+                    digest = f.read().strip()
+            except (IOError, OSError):
+                continue
+            stored = os.path.join(self.content_dir, digest)
+            if os.path.isfile(stored) and check_md5sum(stored, md5sum):
+                self.logger.debug('Using stored file %s for %s' %
+                                  (stored, url))
+                replace_with_link(stored, path)
+                self._index(url, md5sum, digest)
+                return True
+        return False
+
+    def store(self, url, md5sum, path):
+        """Store a file downloaded from a URL by content.
+
+        If a file with the same content is already stored, the file at
+        path is replaced by a link to it.
+
+        """
+        if not os.path.isfile(path):
+            # Directories aren't stored.
+            return
+        digest = sha256sum(path)
+        stored = os.path.join(self.content_dir, digest)
+        if os.path.isfile(stored):
+            if not os.path.samefile(stored, path):
+                replace_with_link(stored, path)
+        else:
+            os.makedirs(self.content_dir, exist_ok=True)
+            replace_with_link(path, stored)
+        self._index(url, md5sum, digest)
+
+    def _index(self, url, md5sum, digest):
+        index_dir = os.path.join(self.content_dir, 'index')
+        os.makedirs(index_dir, exist_ok=True)
+        for index_path in self._index_keys(url, md5sum):
+            with atomic_write(index_path) as f:
+                f.write(digest)
+
     def download(self, url, md5sum=None, path=None):
         """Download a file from a URL to a given or temporary path.
 
@@ -236,6 +399,123 @@ def check_md5sum(path, md5sum):
         f.close()
 
 
+def record_use(path):
+    """Record that a file in a cache was used, so it's pruned last.
+
+    The use is recorded as the access time of the file, which file systems
+    mounted with the noatime or relatime options don't keep up to date.
+
+    """
+    try:
+        os.utime(path, ns=(time.time_ns(), os.stat(path).st_mtime_ns))
+    except OSError:
+        # The cache may be shared and read-only.
+        pass
+
+
+def prune(directory, max_size, logger=None):
+    """Remove the least recently used files in a cache to limit its size.
+
+    Files are removed, in the order they were last used, until the files in
+    the directory take at most max_size bytes.  Hard links to the same file
+    are counted once, and removed together.
+
+    The index of the files stored by content isn't pruned, as it isn't
+    used like the files are.  Its entries are removed with the stored files
+    they refer to.
+
+    Returns the number of files removed.
+
+    """
+    content_dir = os.path.join(directory, '.content')
+    files = {}
+    for dirpath, dirnames, filenames in os.walk(directory):
+        if dirpath == content_dir and 'index' in dirnames:
+            dirnames.remove('index')
+        for filename in filenames:
+            path = os.path.join(dirpath, filename)
+            try:
+                st = os.lstat(path)
+            except OSError:
+                continue
+            key = st.st_dev, st.st_ino
+            if key in files:
+                files[key][2].append(path)
+            else:
+                files[key] = [st.st_atime_ns, st.st_size, [path]]
+
+    size = sum(file_size for (_, file_size, _) in files.values())
+    removed = 0
+    removed_digests = set()
+    for _, file_size, paths in sorted(files.values()):
+        if size <= max_size:
+            break
+        for path in paths:
+            try:
+                os.remove(path)
+            except OSError:
+                pass
+            if os.path.dirname(path) == content_dir:
+                removed_digests.add(os.path.basename(path))
+        size -= file_size
+        removed += 1
+
+    if removed_digests:
+        _remove_index_entries(
+            os.path.join(content_dir, 'index'), removed_digests)
+
+    if removed and logger is not None:
+        logger.info('Removed %s least recently used files from %s.',
+                    removed, directory)
+    return removed
+
+
+def _remove_index_entries(index_dir, digests):
+    """Remove the entries of a content index that refer to digests."""
+    try:
+        names = os.listdir(index_dir)
+    except OSError:
+        return
+    for name in names:
+        path = os.path.join(index_dir, name)
+        try:
+            with open(path) as f:
+                digest = f.read().strip()
+            if digest in digests:
+                os.remove(path)
+        except OSError:
+            pass
+
+
+def sha256sum(path):
+    """Return the SHA-256 checksum of the file at path."""
+    checksum = sha256()
+    with open(path, 'rb') as f:
+        chunk = f.read(2**16)
+        while chunk:
+            checksum.update(chunk)
+            chunk = f.read(2**16)
+    return checksum.hexdigest()
+
+
+def replace_with_link(source, dest):
+    """Make dest a hard link to source, or a copy if that's not possible.
+
+    The file at dest, if any, is replaced atomically.
+
+    """
+    tmp_path = '%s.%s-%s.tmp' % (dest, os.getpid(), threading.get_ident())
+    try:
+        os.link(source, tmp_path)
+    except (AttributeError, OSError):
+        shutil.copyfile(source, tmp_path)
+    try:
+        os.replace(tmp_path, dest)
+    except Exception:
+        os.remove(tmp_path)
+        raise
+
+
 def remove(path):
     if os.path.exists(path):
         os.remove(path)
@@ -23,6 +23,8 @@ import distutils.errors
 import email
 import errno
 import glob
+import hashlib
+import json
 import logging
 import operator
 import os
@@ -49,6 +51,7 @@ from pathlib import Path
 from pkg_resources import Distribution
 from setuptools.wheel import Wheel
 from zc.buildout import WINDOWS
+from zc.buildout.utils import atomic_write
 from zc.buildout.utils import normalize_name
 from zc.buildout.utils import get_pth_paths
 import warnings
@@ -398,6 +401,8 @@ class Installer(object):
     _allow_unknown_extras = False
     _namespace_packages = {}
     _index_url = None
+    _working_set_cache = None
+    _eggs_directory_index = False
 
     def __init__(self,
                  dest=None,
@@ -448,16 +453,27 @@ class Installer(object):
             self._versions = normalize_versions(versions)
 
     def _make_env(self):
-        full_path = self._get_dest_dist_paths() + self._path
-        env = Environment(full_path)
+        if self._eggs_directory_index and self._dest is not None:
+            env = Environment(self._path)
+            for dist in _eggs_directory_dists(self._dest):
+                env.add(dist)
+        else:
+            full_path = self._get_dest_dist_paths() + self._path
+            env = Environment(full_path)
         # this needs to be called whenever self._env is modified (or we could
         # make an Environment subclass):
         self._eggify_env_dest_dists(env, self._dest)
         return env
 
-    def _env_rescan_dest(self):
-        self._env.scan(self._get_dest_dist_paths())
-        self._eggify_env_dest_dists(self._env, self._dest)
+    def _env_add_dest_dists(self, dists):
+        """Add distributions we moved to `dest` to the environment.
+
+        This is much cheaper than scanning `dest` again.
+        """
+        for dist in dists:
+            if os.path.dirname(dist.location) == self._dest:
+                dist.precedence = pkg_resources.EGG_DIST
+                self._env.add(dist)
 
     def _get_dest_dist_paths(self):
         dest = self._dest
@@ -686,6 +702,9 @@ class Installer(object):
             and (realpath(os.path.dirname(dist.location)) == download_cache)
             ):
             logger.debug("Download cache has %s at: %s", dist, dist.location)
+            # zc.buildout.download imports this module.
+            import zc.buildout.download
+            zc.buildout.download.record_use(dist.location)
             return dist
 
         logger.debug("Fetching %s from: %s", dist, dist.location)
@@ -748,7 +767,7 @@ class Installer(object):
                 if tmp != self._download_cache:
                     zc.buildout.rmtree.rmtree(tmp)
 
-            self._env_rescan_dest()
+            self._env_add_dest_dists(dists)
             dist = self._env.best_match(requirement, ws)
 
             logger.info("Got %s.", dist)
@@ -1135,6 +1154,20 @@ def store_required_by(setting=None):
         Installer._store_required_by = bool(setting)
     return old
 
+def working_set_cache(path=-1):
+    old = Installer._working_set_cache
+    if path != -1:
+        if path:
+            path = realpath(path)
+        Installer._working_set_cache = path
+    return old
+
+def eggs_directory_index(setting=None):
+    old = Installer._eggs_directory_index
+    if setting is not None:
+        Installer._eggs_directory_index = bool(setting)
+    return old
+
 def get_picked_versions():
     picked_versions = sorted(Installer._picked_versions.items())
     required_by = Installer._required_by
@@ -1158,13 +1191,268 @@ def install(specs, dest,
     assert include_site_packages is None
     assert allowed_eggs_from_site_packages is None
 
+    cache_file = None
+    if working_set is None:
+        cache_file = _working_set_cache_file(
+            specs, dest, path, versions, allow_unknown_extras,
+            links, index, use_dependency_links, allow_hosts)
+    if cache_file:
+        ws = _load_working_set(cache_file, newest and dest is not None,
+                               check_picked)
+        if ws is not None:
+            return ws
+        picked_versions = dict(Installer._picked_versions)
+
     installer = Installer(dest, links, index, sys.executable,
                           always_unzip, path,
                           newest, versions, use_dependency_links,
                           allow_hosts=allow_hosts,
                           check_picked=check_picked,
                           allow_unknown_extras=allow_unknown_extras)
-    return installer.install(specs, working_set)
+    ws = installer.install(specs, working_set)
+
+    if cache_file:
+        picked = dict(
+            (name, version)
+            for (name, version) in Installer._picked_versions.items()
+            if picked_versions.get(name) != version)
+        # Installing may have changed the distributions available.
+        cache_file = _working_set_cache_file(
+            specs, dest, path, versions, allow_unknown_extras,
+            links, index, use_dependency_links, allow_hosts)
+        _save_working_set(cache_file, ws, installer._versions, picked)
+
+    return ws
+
+# Bump this when the format of recorded working sets changes.
+_working_set_cache_format = 1
+
+def _working_set_cache_file(specs, dest, path, versions,
+                            allow_unknown_extras, links=(), index=None,
+                            use_dependency_links=None, allow_hosts=('*',)):
+    """Return the file recording the working set for an install, if any.
+
+    The name is a digest of the install arguments and settings, including
+    where distributions are found, and of the modification times of the
+    directories used, which change when distributions are added to or
+    removed from them.
+    """
+    cache = Installer._working_set_cache
+    if not cache or Installer._store_required_by:
+        # If we're asked to record why distributions are required, we
+        # need a full resolution.
+        return None
+
+    if versions is None:
+        versions = Installer._versions
+    else:
+        versions = normalize_versions(versions)
+    if dest is not None:
+        dest = pkg_resources.normalize_path(dest)
+    path = (path and path[:] or []) + buildout_and_setuptools_path
+    if use_dependency_links is None:
+        use_dependency_links = Installer._use_dependency_links
+    directories = []
+    for directory in [dest] + path:
+        try:
+            mtime = os.stat(directory).st_mtime_ns if directory else None
+        except OSError:
+            mtime = None
+        directories.append((directory, mtime))
+
+    key = json.dumps([
+        _working_set_cache_format,
+        sys.version, sys.executable,
+        list(specs), dest, sorted(versions.items()),
+        Installer._prefer_final, Installer._allow_picked_versions,
+        Installer._install_from_cache, bool(allow_unknown_extras),
+        index or Installer._index_url, list(links), list(allow_hosts),
+        bool(use_dependency_links), Installer._download_cache,
+        directories,
+        ])
+    return os.path.join(
+        cache, hashlib.sha256(key.encode()).hexdigest() + '.json')
+
+def _metadata_stat(dist):
+    """Return the state of the metadata of a develop distribution.
+
+    Unlike installed eggs, the metadata of develop distributions changes
+    in place, for example when their requirements change.
+    """
+    egg_info = getattr(dist._provider, 'egg_info', None)
+    if not egg_info or not os.path.isdir(egg_info):
+        return None
+    result = []
+    for name in sorted(os.listdir(egg_info)):
+        st = os.stat(os.path.join(egg_info, name))
+        result.append([name, st.st_mtime_ns, st.st_size])
+    return result
+
+def _save_working_set(cache_file, ws, versions, picked):
+    dists = []
+    pinned = True
+    for dist in ws:
+        if dist.precedence == pkg_resources.DEVELOP_DIST:
+            stat = _metadata_stat(dist)
+        else:
+            stat = None
+            constraint = versions.get(canonicalize_name(dist.project_name))
+            if not constraint or constraint[0] in '<>!~':
+                pinned = False
+        dists.append([dist.project_name, dist.version, dist.location,
+                      dist.precedence, stat])
+
+    with atomic_write(cache_file) as f:
+        json.dump(dict(dists=dists, pinned=pinned, picked=picked), f)
+
+def _load_working_set(cache_file, newest, check_picked):
+    """Return the working set recorded in cache_file, if it's still valid.
+
+    If we want the newest distributions, a recorded working set is only
+    used if all of its distributions are pinned or develop distributions.
+    """
+    try:
+        with open(cache_file) as f:
+            data = json.load(f)
+    except (OSError, ValueError):
+        return None
+    if newest and not data['pinned']:
+        return None
+
+    ws = pkg_resources.WorkingSet([])
+    found = {}
+    for name, version, location, precedence, stat in data['dists']:
+        if location not in found:
+            found[location] = list(pkg_resources.find_distributions(location))
+        for dist in found[location]:
+            if dist.project_name == name and dist.version == version:
+                break
+        else:
+            return None
+        if stat is not None and _metadata_stat(dist) != stat:
+            return None
+        dist.precedence = precedence
+        ws.add(dist)
+
+    if check_picked:
+        Installer._picked_versions.update(data['picked'])
+    logger.debug('Using working set recorded in %s.', cache_file)
+    return ws
+
+# Bump this when the format of eggs directory indexes changes.
+_eggs_directory_index_format = 1
+
+# Indexes read in this process, by eggs directory.
+_eggs_directory_indexes = {}
+
+def _eggs_directory_index_file(dest):
+    return dest + '.index.json'
+
+def _index_eggs_directory_entry(dest, name):
+    """Return how to find the distributions in an eggs directory entry.
+
+    This is a tuple of a kind and, for directories with distributions
+    installed by pip, the names of their metadata entries.  Eggs directory
+    entries are never changed once they are there.
+    """
+    path = os.path.join(dest, name)
+    is_egg = name.lower().endswith('.egg')
+    if is_egg and os.path.isfile(os.path.join(path, 'EGG-INFO', 'PKG-INFO')):
+        return 'egg', None
+    if not os.path.isdir(path):
+        if is_egg:
+            # A zipped egg, which we let pkg_resources look at.
+            return 'path', None
+        return None, None
+    metadata = []
+    for entry in sorted(os.listdir(path)):
+        lower = entry.lower()
+        if lower.endswith('.dist-info') or lower.endswith('.egg-info'):
+            is_dir = os.path.isdir(os.path.join(path, entry))
+            if is_dir and not os.listdir(os.path.join(path, entry)):
+                continue
+            metadata.append((entry, is_dir))
+    if not is_egg and not any(
+            entry.lower().endswith('.dist-info') for entry, _ in metadata):
+        # Other than eggs, only directories with a dist-info directory
+        # hold distributions, see Installer._get_dest_dist_paths.
+        return None, None
+    return 'metadata', metadata
+
+def _eggs_directory_entry_dists(dest, name, kind, metadata):
+    path = os.path.join(dest, name)
+    if kind == 'egg':
+        return [Distribution.from_filename(
+            path,
+            metadata=pkg_resources.PathMetadata(
+                path, os.path.join(path, 'EGG-INFO')),
+            )]
+    if kind == 'metadata':
+        dists = []
+        for entry, is_dir in metadata:
+            if is_dir:
+                entry_metadata = pkg_resources.PathMetadata(
+                    path, os.path.join(path, entry))
+            else:
+                entry_metadata = pkg_resources.FileMetadata(
+                    os.path.join(path, entry))
+            dists.append(Distribution.from_location(
+                path, entry, entry_metadata,
+                precedence=pkg_resources.DEVELOP_DIST))
+        return dists
+    if kind == 'path':
+        return list(pkg_resources.find_distributions(path))
+    return []
+
+def _eggs_directory_dists(dest):
+    """Return the distributions in an eggs directory, using its index.
+
+    The index is stored next to the eggs directory and is valid as long
+    as the modification time of the directory is the same.  Otherwise
+    only the entries that were added since the index was written are
+    looked at, and the index is updated.
+    """
+    try:
+        mtime = os.stat(dest).st_mtime_ns
+    except OSError:
+        return []
+
+    index_file = _eggs_directory_index_file(dest)
+    data = _eggs_directory_indexes.get(dest)
+    if data is None or data['mtime'] != mtime:
+        try:
+            with open(index_file) as f:
+                data = json.load(f)
+        except (OSError, ValueError):
+            data = None
+        if data is not None and data.get('format') != (
+                _eggs_directory_index_format):
+            data = None
+
+    if data is None or data['mtime'] != mtime:
+        entries = data['entries'] if data is not None else {}
+        # We got the modification time before listing the directory, so
+        # if it changes while we're at it, we'll look again next time.
+        new_entries = {}
+        for name in sorted(os.listdir(dest)):
+            if name in entries:
+                new_entries[name] = entries[name]
+            else:
+                new_entries[name] = _index_eggs_directory_entry(dest, name)
+        data = dict(format=_eggs_directory_index_format, mtime=mtime,
+                    entries=new_entries)
+        try:
+            with atomic_write(index_file) as f:
+                json.dump(data, f)
+        except OSError:
+            logger.debug("Couldn't write eggs directory index %s.",
+                         index_file)
+    _eggs_directory_indexes[dest] = data
+
+    dists = []
+    for name, (kind, metadata) in sorted(data['entries'].items()):
+        dists.extend(_eggs_directory_entry_dists(dest, name, kind, metadata))
+    return dists
 
 buildout_and_setuptools_dists = list(install(['zc.buildout'], None,
                                              check_picked=False))
@@ -1265,6 +1553,9 @@ def _copyeggs(src, dest, suffix, undo):
 
 
 def _copy_metadata(src, dest, undo):
+    """Move metadata and finders from src to dest, returning the new paths.
+    """
+    result = []
     for name in os.listdir(src):
         if name == '__pycache__':
             continue
@@ -1277,6 +1568,8 @@ def _copy_metadata(src, dest, undo):
         _rm(new)
         old = os.path.join(src, name)
         os.rename(old, new)
+        result.append(new)
+    return result
 
 
 _develop_distutils_scripts = {}
@@ -1343,7 +1636,8 @@ def _detect_distutils_scripts(directory):
 
 def develop(setup, dest,
             build_ext=None,
-            executable=sys.executable):
+            executable=sys.executable,
+            created=None):
     """Make a development/editable install of a package.
 
     This expects to get a path to a directory or a file as the first argument.
@@ -1363,6 +1657,10 @@ def develop(setup, dest,
     code assumes you are using setuptools.  It will create or edit a
     `setup.cfg` file in the package directory and put the build_ext
     options in there.
+
+    If `created` is given, the paths of the files created in `dest` are
+    added to it.  This is useful when making several editable installs
+    at the same time.
     """
     assert executable == sys.executable, (executable, sys.executable)
     if os.path.isdir(setup):
@@ -1414,11 +1712,15 @@ def develop(setup, dest,
         egg_link = _copyeggs(tmp3, dest, '.egg-link', undo)
         if egg_link:
             logger.debug("Successfully made editable install: %s", egg_link)
+            if created is not None:
+                created.append(egg_link)
             return egg_link
 
         # For newer setuptools (80+) or other PEP 660 backends, we copy
         # the metadata and finders to the destination.
-        _copy_metadata(tmp3, dest, undo)
+        metadata = _copy_metadata(tmp3, dest, undo)
+        if created is not None:
+            created.extend(metadata)
         _detect_distutils_scripts(tmp3)
 
         # We also create an .egg-link file for backward compatibility with
@@ -1426,6 +1728,8 @@ def develop(setup, dest,
         egg_link = _create_egg_link(directory, dest, egg_name)
         if egg_link:
             logger.debug("Successfully made editable install: %s", egg_link)
+            if created is not None:
+                created.append(egg_link)
 
         return egg_link
 
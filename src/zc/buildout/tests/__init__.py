@@ -18,6 +18,8 @@ import sys
 import shutil
 import tempfile
 import zc.buildout
+import zc.buildout.easy_install
+import zc.buildout.testing
 
 
 def create_sample_eggs(test, executable=sys.executable):
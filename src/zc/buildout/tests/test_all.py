@@ -272,7 +272,28 @@ It is an error to create a variable-reference cycle:
       Getting option buildout:y.
       Getting option buildout:z.
       Getting option buildout:x.
-    Error: Circular reference in substitutions.
+    Error: Circular reference in substitutions:
+      buildout:x -> buildout:y -> buildout:z -> buildout:x
+
+Only the options that are part of the cycle are reported:
+
+    >>> write(sample_buildout, 'buildout.cfg',
+    ... '''
+    ... [buildout]
+    ... parts =
+    ... x = ${a:y}
+    ... [a]
+    ... y = ${:z}
+    ... z = ${a:y}
+    ... ''')
+
+    >>> print_(system(os.path.join(sample_buildout, 'bin', 'buildout')),
+    ...        end='')
+    ... # doctest: +NORMALIZE_WHITESPACE +ELLIPSIS
+    While:
+      ...
+    Error: Circular reference in substitutions:
+      a:y -> a:z -> a:y
 
 It is an error to use funny characters in variable references:
 
@@ -2934,6 +2955,1600 @@ def increment_on_command_line():
       recipe='zc.buildout:debug'
     """
 
+def config_cache_reuses_merged_configuration():
+    r"""
+    When ``config-cache`` is set on the command line or in the user
+    defaults, the merged configuration is stored there and reused as long
+    as none of the files that contributed to it changed.
+
+    >>> write('base.cfg', '''
+    ... [buildout]
+    ... parts =
+    ... [x]
+    ... y = 1
+    ... ''')
+    >>> write('buildout.cfg', '''
+    ... [buildout]
+    ... extends = base.cfg
+    ... optional-extends = local.cfg
+    ... ''')
+    >>> print_(system(buildout+' config-cache=cache query x:y'), end='')
+    optional-extends file not found: local.cfg
+    1
+
+    The compiled configuration is stored as JSON, so reading it can't run
+    code:
+
+    >>> import json
+    >>> [cached] = os.listdir('cache')
+    >>> with open(join('cache', cached)) as f:
+    ...     sources, data, missing = json.load(f)
+    >>> data['x']['y']
+    ['1', [['SET', '1', '/sample-buildout/base.cfg']]]
+
+    Change the base configuration behind buildout's back, keeping its size,
+    inode and modification time.  The compiled configuration is used, and
+    the missing optional extends file is still reported:
+
+    >>> st = os.stat('base.cfg')
+    >>> with open('base.cfg', 'r+') as f:
+    ...     text = f.read()
+    ...     _ = f.seek(0)
+    ...     _ = f.write(text.replace('y = 1', 'y = 2'))
+    >>> os.utime('base.cfg', ns=(st.st_atime_ns, st.st_mtime_ns))
+    >>> print_(system(buildout+' config-cache=cache query x:y'), end='')
+    optional-extends file not found: local.cfg
+    1
+
+    A real modification is noticed:
+
+    >>> os.utime('base.cfg', ns=(st.st_atime_ns, st.st_mtime_ns + 10**9))
+    >>> print_(system(buildout+' config-cache=cache query x:y'), end='')
+    optional-extends file not found: local.cfg
+    2
+
+    So is the appearance of a missing optional extends file:
+
+    >>> write('local.cfg', '''
+    ... [x]
+    ... y = 3
+    ... ''')
+    >>> print_(system(buildout+' config-cache=cache query x:y'), end='')
+    3
+
+    Other command-line options give different compiled configurations:
+
+    >>> print_(system(buildout+' config-cache=cache x:z=4 query x:z'), end='')
+    4
+    >>> len(os.listdir('cache'))
+    2
+    """
+
+def parallel_extends_keeps_merge_order():
+    r"""
+    With ``parallel-extends``, the remote configuration files a
+    configuration extends are downloaded concurrently, but they are
+    still merged in order:
+
+    >>> server_data = tmpdir('server_data')
+    >>> server_url = start_server(server_data)
+    >>> write(server_data, 'base.cfg', '''
+    ... [buildout]
+    ... extends = one.cfg two.cfg
+    ... [x]
+    ... y = base
+    ... ''')
+    >>> write(server_data, 'one.cfg', '''
+    ... [x]
+    ... y = one
+    ... z = one
+    ... ''')
+    >>> write(server_data, 'two.cfg', '''
+    ... [x]
+    ... z = two
+    ... ''')
+    >>> write(server_data, 'three.cfg', '''
+    ... [x]
+    ... y += three
+    ... ''')
+    >>> write('buildout.cfg', '''
+    ... [buildout]
+    ... extends = %sbase.cfg %sthree.cfg
+    ... parallel-extends = 4
+    ... parts =
+    ... ''' % (server_url, server_url))
+    >>> print_(system(buildout+' query x:y'), end='')
+    base
+    three
+    >>> print_(system(buildout+' query x:z'), end='')
+    two
+
+    The same is true when the downloads are cached:
+
+    >>> mkdir('cache')
+    >>> print_(system(buildout+' extends-cache=cache query x:z'), end='')
+    two
+    >>> len(os.listdir('cache'))
+    4
+
+    The option must be a number:
+
+    >>> print_(system(buildout+' parallel-extends=many query x:z'), end='')
+    While:
+      Initializing.
+    Error: Invalid value for parallel-extends option: many
+    """
+
+def shared_extends_are_parsed_once():
+    r"""
+    A file that is extended by several other files is only parsed once,
+    but its options are merged at each place it's included:
+
+    >>> write('versions.cfg', '''
+    ... [x]
+    ... y = versions
+    ... ''')
+    >>> write('a.cfg', '''
+    ... [buildout]
+    ... extends = versions.cfg
+    ... [x]
+    ... y += a
+    ... ''')
+    >>> write('b.cfg', '''
+    ... [buildout]
+    ... extends = versions.cfg
+    ... [x]
+    ... y += b
+    ... ''')
+    >>> write('buildout.cfg', '''
+    ... [buildout]
+    ... extends = a.cfg b.cfg
+    ... parts =
+    ... ''')
+
+    >>> import zc.buildout.buildout
+    >>> import zc.buildout.configparser
+    >>> parse = zc.buildout.configparser.parse
+    >>> parsed = []
+    >>> def counting_parse(fp, fpname, exp_globals=dict):
+    ...     parsed.append(os.path.basename(fpname))
+    ...     return parse(fp, fpname, exp_globals)
+    >>> zc.buildout.configparser.parse = counting_parse
+    >>> try:
+    ...     buildout = zc.buildout.buildout.Buildout(
+    ...         'buildout.cfg', [], use_user_defaults=False)
+    ... finally:
+    ...     zc.buildout.configparser.parse = parse
+    >>> sorted(parsed)
+    ['a.cfg', 'b.cfg', 'buildout.cfg', 'versions.cfg']
+    >>> print_(buildout['x']['y'])
+    versions
+    b
+    """
+
+def merging_shares_unchanged_section_keys():
+    r"""
+    When configurations are merged, the options that don't change are
+    shared with the configurations being merged, and the ones that do
+    change are copied first, so the inputs are left alone:
+
+    >>> from zc.buildout.buildout import SectionKey, _update
+    >>> base = {
+    ...     'x': {'a': SectionKey('1', 'base.cfg'),
+    ...           'b': SectionKey('2', 'base.cfg')},
+    ...     'y': {'c': SectionKey('5', 'base.cfg')},
+    ...     }
+    >>> layer = {
+    ...     'x': {'a': SectionKey('3', 'layer.cfg'),
+    ...           'b +': SectionKey('4', 'layer.cfg')},
+    ...     }
+    >>> merged = _update(base, layer)
+    >>> merged['x']['a'].value, merged['x']['b'].value.split()
+    ('3', ['2', '4'])
+    >>> [item.operation for item in merged['x']['b'].history]
+    ['SET', 'ADD']
+
+    >>> base['x']['a'].value, base['x']['b'].value
+    ('1', '2')
+    >>> [item.operation for item in base['x']['b'].history]
+    ['SET']
+    >>> sorted(layer['x'])
+    ['a', 'b +']
+
+    >>> merged['y']['c'] is base['y']['c']
+    True
+    >>> merged['y'] is base['y']
+    False
+    """
+
+def option_history_is_only_kept_in_full_for_annotate():
+    r"""
+    Only the annotate command shows how options got their values through
+    all the configuration files.  Other commands only keep track of what
+    happened since an option was last set:
+
+    >>> write('base.cfg', '''
+    ... [x]
+    ... y = 1
+    ... ''')
+    >>> write('buildout.cfg', '''
+    ... [buildout]
+    ... extends = base.cfg
+    ... parts =
+    ... [x]
+    ... y = 2
+    ... ''')
+
+    >>> import zc.buildout.buildout
+    >>> def operations(command):
+    ...     buildout = zc.buildout.buildout.Buildout(
+    ...         'buildout.cfg', [], command=command)
+    ...     return [item.operation
+    ...             for item in buildout._annotated['x']['y'].history]
+    >>> operations('annotate')
+    ['SET', 'OVERRIDE']
+    >>> operations('install')
+    ['OVERRIDE']
+
+    The setting belongs to each buildout, so building one for annotate
+    doesn't change another one:
+
+    >>> buildout = zc.buildout.buildout.Buildout(
+    ...     'buildout.cfg', [], command='install')
+    >>> _ = zc.buildout.buildout.Buildout(
+    ...     'buildout.cfg', [], command='annotate')
+    >>> y = buildout._annotated['x']['y'].copy()
+    >>> y.overrideValue(zc.buildout.buildout.SectionKey('3', 'test'))
+    >>> [item.operation for item in y.history]
+    ['OVERRIDE']
+    """
+
+def working_set_cache_skips_resolution():
+    """
+    With a working set cache, the distributions found for a set of
+    requirements are recorded, and used again as long as the settings and
+    the distributions available don't change:
+
+    >>> import zc.buildout.easy_install
+    >>> dest = tmpdir('sample-install')
+    >>> cache = tmpdir('working-set-cache')
+    >>> old_cache = zc.buildout.easy_install.working_set_cache(cache)
+    >>> ws = zc.buildout.easy_install.install(
+    ...     ['demo'], dest, links=[link_server], index=link_server+'index/',
+    ...     versions=dict(demo='0.2', demoneeded='1.1'))
+    >>> print_(sorted(str(dist) for dist in ws))
+    ['demo 0.2', 'demoneeded 1.1']
+    >>> len(os.listdir(cache))
+    1
+
+    The recorded working set is used without looking for distributions:
+
+    >>> Installer = zc.buildout.easy_install.Installer
+    >>> class NoInstaller(Installer):
+    ...     def install(self, specs, working_set=None):
+    ...         raise AssertionError('resolving')
+    >>> zc.buildout.easy_install.Installer = NoInstaller
+    >>> ws = zc.buildout.easy_install.install(
+    ...     ['demo'], dest, links=[link_server], index=link_server+'index/',
+    ...     versions=dict(demo='0.2', demoneeded='1.1'))
+    >>> print_(sorted((str(dist), dist.location) for dist in ws))
+    [('demo 0.2', '/sample-install/demo-0.2-py2.4.egg'),
+     ('demoneeded 1.1', '/sample-install/demoneeded-1.1-py2.4.egg')]
+
+    But only if all distributions are pinned, because otherwise we might
+    need to look for newer distributions:
+
+    >>> zc.buildout.easy_install.Installer = Installer
+    >>> ws = zc.buildout.easy_install.install(
+    ...     ['demo'], dest, links=[link_server], index=link_server+'index/',
+    ...     versions=dict(demo='0.2'))
+    >>> zc.buildout.easy_install.Installer = NoInstaller
+    >>> zc.buildout.easy_install.install(
+    ...     ['demo'], dest, links=[link_server], index=link_server+'index/',
+    ...     versions=dict(demo='0.2'))
+    Traceback (most recent call last):
+    ...
+    AssertionError: resolving
+    >>> ws = zc.buildout.easy_install.install(
+    ...     ['demo'], dest, links=[link_server], index=link_server+'index/',
+    ...     versions=dict(demo='0.2'), newest=False)
+    >>> print_(sorted(str(dist) for dist in ws))
+    ['demo 0.2', 'demoneeded 1.1']
+
+    So is changing where distributions are looked for:
+
+    >>> zc.buildout.easy_install.install(
+    ...     ['demo'], dest, links=[link_server], index=link_server+'other/',
+    ...     versions=dict(demo='0.2', demoneeded='1.1'))
+    Traceback (most recent call last):
+    ...
+    AssertionError: resolving
+    >>> zc.buildout.easy_install.install(
+    ...     ['demo'], dest, links=[], index=link_server+'index/',
+    ...     versions=dict(demo='0.2', demoneeded='1.1'))
+    Traceback (most recent call last):
+    ...
+    AssertionError: resolving
+    >>> zc.buildout.easy_install.install(
+    ...     ['demo'], dest, links=[link_server], index=link_server+'index/',
+    ...     versions=dict(demo='0.2', demoneeded='1.1'),
+    ...     allow_hosts=('example.com', ))
+    Traceback (most recent call last):
+    ...
+    AssertionError: resolving
+    >>> zc.buildout.easy_install.install(
+    ...     ['demo'], dest, links=[link_server], index=link_server+'index/',
+    ...     versions=dict(demo='0.2', demoneeded='1.1'),
+    ...     use_dependency_links=False)
+    Traceback (most recent call last):
+    ...
+    AssertionError: resolving
+
+    When the distributions available change, the working set is resolved
+    again:
+
+    >>> [name] = [name for name in os.listdir(dest)
+    ...           if name.startswith('demoneeded')]
+    >>> rmdir(dest, name)
+    >>> zc.buildout.easy_install.install(
+    ...     ['demo'], dest, links=[link_server], index=link_server+'index/',
+    ...     versions=dict(demo='0.2', demoneeded='1.1'))
+    Traceback (most recent call last):
+    ...
+    AssertionError: resolving
+
+    >>> zc.buildout.easy_install.Installer = Installer
+    >>> _ = zc.buildout.easy_install.working_set_cache(old_cache)
+    """
+
+def eggs_directory_index_is_updated_incrementally():
+    """
+    With the eggs directory index enabled, the distributions in the eggs
+    directory are found using an index stored next to it:
+
+    >>> import json
+    >>> import zc.buildout.easy_install
+    >>> dest = tmpdir('sample-install')
+    >>> old_setting = zc.buildout.easy_install.eggs_directory_index(True)
+    >>> index_entry = zc.buildout.easy_install._index_eggs_directory_entry
+    >>> def log_index_entry(dest, name):
+    ...     print_('indexing', name.split('-py')[0])
+    ...     return index_entry(dest, name)
+    >>> zc.buildout.easy_install._index_eggs_directory_entry = log_index_entry
+    >>> ws = zc.buildout.easy_install.install(
+    ...     ['demo'], dest, links=[link_server], index=link_server+'index/',
+    ...     versions=dict(demo='0.2', demoneeded='1.1'))
+    >>> installer = zc.buildout.easy_install.Installer(dest)
+    indexing demo-0.2
+    indexing demoneeded-1.1
+    >>> with open(dest + '.index.json') as f:
+    ...     entries = json.load(f)['entries']
+    >>> for name in sorted(entries):
+    ...     print_(name.split('-py')[0], entries[name][0])
+    demo-0.2 metadata
+    demoneeded-1.1 metadata
+
+    As long as the eggs directory doesn't change, it isn't looked at:
+
+    >>> zc.buildout.easy_install._eggs_directory_indexes.clear()
+    >>> installer = zc.buildout.easy_install.Installer(dest)
+    >>> print_([str(dist) for dist in installer._env['demoneeded']])
+    ['demoneeded 1.1']
+
+    When distributions are added, only they are indexed:
+
+    >>> ws = zc.buildout.easy_install.install(
+    ...     ['demoneeded'], dest, links=[link_server],
+    ...     index=link_server+'index/', versions=dict(demoneeded='1.0'))
+    >>> installer = zc.buildout.easy_install.Installer(dest)
+    indexing demoneeded-1.0
+    >>> print_([str(dist) for dist in installer._env['demoneeded']])
+    ['demoneeded 1.1', 'demoneeded 1.0']
+
+    >>> zc.buildout.easy_install._index_eggs_directory_entry = index_entry
+    >>> _ = zc.buildout.easy_install.eggs_directory_index(old_setting)
+    """
+
+def installed_dists_are_added_to_environment():
+    """
+    The eggs directory is only scanned when an installer is created.
+    Distributions installed later are added to its environment directly:
+
+    >>> import zc.buildout.easy_install
+    >>> Installer = zc.buildout.easy_install.Installer
+    >>> get_dest_dist_paths = Installer._get_dest_dist_paths
+    >>> def log_get_dest_dist_paths(self):
+    ...     print_('scanning')
+    ...     return get_dest_dist_paths(self)
+    >>> Installer._get_dest_dist_paths = log_get_dest_dist_paths
+    >>> dest = tmpdir('sample-install')
+    >>> installer = Installer(
+    ...     dest, links=[link_server], index=link_server+'index/',
+    ...     versions=dict(demo='0.2', demoneeded='1.1'))
+    scanning
+    >>> ws = installer.install(['demo'])
+    >>> print_(sorted(str(dist) for dist in ws))
+    ['demo 0.2', 'demoneeded 1.1']
+    >>> for project in sorted(installer._env):
+    ...     if project.startswith('demo'):
+    ...         for dist in installer._env[project]:
+    ...             print_(dist, dist.precedence == pkg_resources.EGG_DIST)
+    demo 0.2 True
+    demoneeded 1.1 True
+
+    >>> Installer._get_dest_dist_paths = get_dest_dist_paths
+    """
+
+def parallel_parts_follow_part_dependencies():
+    r"""
+    With the parallel-parts option, parts that don't depend on each
+    other are installed at the same time.  Here, part a waits for part b
+    to be installed, which only works if they're installed together:
+
+    >>> mkdir('recipe')
+    >>> write('recipe', 'recipe.py',
+    ... '''
+    ... import os
+    ... import threading
+    ... import time
+    ... class Recipe:
+    ...     def __init__(self, buildout, name, options):
+    ...         self.options = options
+    ...         options['path'] = os.path.join(
+    ...             buildout['buildout']['parts-directory'], name)
+    ...     def install(self):
+    ...         wait_for = self.options.get('wait-for')
+    ...         if wait_for:
+    ...             for i in range(50):
+    ...                 if os.path.exists(wait_for):
+    ...                     break
+    ...                 time.sleep(0.1)
+    ...             else:
+    ...                 raise ValueError('%s was not installed' % wait_for)
+    ...         for path in self.options.get('needs', '').split():
+    ...             assert os.path.exists(path), path
+    ...         open(self.options['path'], 'w').close()
+    ...         return self.options['path']
+    ...     update = install
+    ... meeting = threading.Barrier(2, timeout=10)
+    ... class Meet:
+    ...     def __init__(self, buildout, name, options):
+    ...         self.directory = buildout['buildout']['directory']
+    ...     def install(self):
+    ...         # Only returns once both parts are being installed.
+    ...         meeting.wait()
+    ...         assert os.path.samefile(os.getcwd(), self.directory)
+    ...         return ()
+    ...     update = install
+    ... ''')
+    >>> write('recipe', 'setup.py',
+    ... '''
+    ... from setuptools import setup
+    ... setup(name='recipe', py_modules=['recipe'],
+    ...       entry_points={'zc.buildout': ['default = recipe:Recipe',
+    ...                                     'meet = recipe:Meet']})
+    ... ''')
+
+    Part c uses part a, so it's only installed after a:
+
+    >>> write('buildout.cfg',
+    ... '''
+    ... [buildout]
+    ... develop = recipe
+    ... parts = a b c
+    ... parallel-parts = 3
+    ...
+    ... [a]
+    ... recipe = recipe
+    ... wait-for = parts/b
+    ...
+    ... [b]
+    ... recipe = recipe
+    ...
+    ... [c]
+    ... recipe = recipe
+    ... needs = ${a:path}
+    ... ''')
+    >>> print_(system(buildout+' -q'), end='')
+    >>> ls('parts')
+    -  a
+    -  b
+    -  c
+
+    Parts are recorded in the order they'd be installed in one at a time,
+    whatever order they were installed in, so the installed database
+    doesn't change from one run to the next:
+
+    >>> with open('.installed.cfg') as f:
+    ...     print_([line for line in f if line.startswith('parts =')])
+    ['parts = a b c\n']
+
+    Parts that depend on each other are installed one at a time, with a
+    warning, as that's probably a mistake:
+
+    >>> write('buildout.cfg',
+    ... '''
+    ... [buildout]
+    ... develop = recipe
+    ... parts = a b c
+    ... parallel-parts = 3
+    ...
+    ... [a]
+    ... recipe = recipe
+    ... => c
+    ...
+    ... [b]
+    ... recipe = recipe
+    ... => a
+    ...
+    ... [c]
+    ... recipe = recipe
+    ... => b
+    ... ''')
+    >>> print_(system(buildout+' -q'), end='')
+    Parts depend on each other: b -> a -> c -> b. Installing b first.
+    >>> with open('.installed.cfg') as f:
+    ...     print_([line for line in f if line.startswith('parts =')])
+    ['parts = b c a\n']
+
+    When a part fails, the parts that are being installed at the same
+    time are still recorded, but no other parts are installed:
+
+    >>> remove('.installed.cfg')
+    >>> for name in 'abc':
+    ...     remove('parts', name)
+    >>> write('buildout.cfg',
+    ... '''
+    ... [buildout]
+    ... develop = recipe
+    ... parts = a b c
+    ... parallel-parts = 3
+    ...
+    ... [a]
+    ... recipe = recipe
+    ... wait-for = parts/nothing
+    ...
+    ... [b]
+    ... recipe = recipe
+    ...
+    ... [c]
+    ... recipe = recipe
+    ... needs = ${a:path}
+    ... ''')
+    >>> print_(system(buildout+' -q'), end='')
+    While:
+      Installing a.
+    <BLANKLINE>
+    An internal error occurred due to a bug in either zc.buildout or in a
+    recipe being used:
+    Traceback (most recent call last):
+    ...
+    ValueError: parts/nothing was not installed
+    >>> ls('parts')
+    -  b
+    >>> with open('.installed.cfg') as f:
+    ...     print_([line for line in f if line.startswith('parts =')])
+    ['parts = b\n']
+
+    Parts are installed in the buildout directory.  Here, parts d and e
+    wait for each other, so they must be installed at the same time:
+
+    >>> write('buildout.cfg',
+    ... '''
+    ... [buildout]
+    ... develop = recipe
+    ... parts = d e
+    ... parallel-parts = 2
+    ...
+    ... [d]
+    ... recipe = recipe:meet
+    ...
+    ... [e]
+    ... recipe = recipe:meet
+    ... ''')
+    >>> print_(system(buildout+' -q'), end='')
+    >>> with open('.installed.cfg') as f:
+    ...     print_([line for line in f if line.startswith('parts =')])
+    ['parts = d e\n']
+
+    The option must be a number:
+
+    >>> write('buildout.cfg',
+    ... '''
+    ... [buildout]
+    ... parts = a b
+    ... parallel-parts = many
+    ...
+    ... [a]
+    ... recipe = recipe
+    ...
+    ... [b]
+    ... recipe = recipe
+    ... ''')
+    >>> print_(system(buildout+' -q'), end='')
+    While:
+      Installing.
+    Error: Invalid value for parallel-parts option: many
+    """
+
+def unchanged_runs_are_skipped():
+    r"""
+    With the skip-unchanged-run option, and when not looking for newer
+    distributions, buildout records what a run depended on, and skips
+    the next run if nothing changed, without loading recipes:
+
+    >>> mkdir('recipe')
+    >>> write('recipe', 'recipe.py',
+    ... '''
+    ... import os
+    ... class Recipe:
+    ...     def __init__(self, buildout, name, options):
+    ...         print('Loading recipe for %s' % name)
+    ...         self.options = options
+    ...         options['path'] = os.path.join(
+    ...             buildout['buildout']['parts-directory'], name)
+    ...     def install(self):
+    ...         open(self.options['path'], 'w').close()
+    ...         return self.options['path']
+    ...     def update(self):
+    ...         pass
+    ... ''')
+    >>> write('recipe', 'setup.py',
+    ... '''
+    ... from setuptools import setup
+    ... setup(name='recipe', py_modules=['recipe'],
+    ...       entry_points={'zc.buildout': ['default = recipe:Recipe']})
+    ... ''')
+    >>> write('buildout.cfg',
+    ... '''
+    ... [buildout]
+    ... develop = recipe
+    ... parts = a
+    ... newest = false
+    ... skip-unchanged-run = true
+    ...
+    ... [a]
+    ... recipe = recipe
+    ... ''')
+    >>> print_(system(buildout), end='')
+    Develop: '/sample-buildout/recipe'
+    Loading recipe for a
+    Installing a.
+    >>> print_(system(buildout), end='')
+    Nothing changed since the last run.
+
+    Changing the configuration, or the develop directories, causes a full
+    run:
+
+    >>> write('buildout.cfg',
+    ... '''
+    ... [buildout]
+    ... develop = recipe
+    ... parts = a
+    ... newest = false
+    ... skip-unchanged-run = true
+    ...
+    ... [a]
+    ... recipe = recipe
+    ... x = 1
+    ... ''')
+    >>> print_(system(buildout), end='')
+    Develop: '/sample-buildout/recipe'
+    Loading recipe for a
+    Uninstalling a.
+    Installing a.
+    >>> print_(system(buildout), end='')
+    Nothing changed since the last run.
+    >>> write('recipe', 'README.txt', 'A recipe')
+    >>> print_(system(buildout), end='')
+    Develop: '/sample-buildout/recipe'
+    Loading recipe for a
+    Uninstalling a.
+    Installing a.
+    >>> print_(system(buildout), end='')
+    Nothing changed since the last run.
+
+    So does removing installed files:
+
+    >>> remove('parts', 'a')
+    >>> print_(system(buildout), end='')
+    Develop: '/sample-buildout/recipe'
+    Loading recipe for a
+    Uninstalling a.
+    Installing a.
+
+    Runs aren't skipped when looking for newer distributions:
+
+    >>> print_(system(buildout+' -n'), end='')
+    Develop: '/sample-buildout/recipe'
+    Loading recipe for a
+    Updating a.
+    """
+
+def unchanged_develop_directories_are_not_installed_again():
+    r"""
+    With the skip-unchanged-develop option, develop directories are only
+    installed again if the files used to build them changed:
+
+    >>> mkdir('foo')
+    >>> write('foo', 'foo.py', '')
+    >>> write('foo', 'setup.py',
+    ... '''
+    ... from setuptools import setup
+    ... setup(name='foo', py_modules=['foo'])
+    ... ''')
+    >>> mkdir('bar')
+    >>> write('bar', 'bar.py', '')
+    >>> write('bar', 'setup.py',
+    ... '''
+    ... from setuptools import setup
+    ... setup(name='bar', py_modules=['bar'])
+    ... ''')
+    >>> write('buildout.cfg',
+    ... '''
+    ... [buildout]
+    ... develop = foo bar
+    ... parts =
+    ... skip-unchanged-develop = true
+    ... ''')
+    >>> print_(system(buildout), end='')
+    Develop: '/sample-buildout/foo'
+    Develop: '/sample-buildout/bar'
+    >>> print_(system(buildout), end='')
+    Develop: '/sample-buildout/foo' (unchanged)
+    Develop: '/sample-buildout/bar' (unchanged)
+    >>> ls('develop-eggs')
+    -  bar.egg-link
+    -  foo.egg-link
+    -  zc.recipe.egg.egg-link
+
+    Changing sources doesn't matter, as they're used in place, but
+    changing the setup does:
+
+    >>> write('foo', 'foo.py', 'x = 1')
+    >>> write('bar', 'setup.py',
+    ... '''
+    ... from setuptools import setup
+    ... setup(name='bar', version='2', py_modules=['bar'])
+    ... ''')
+    >>> print_(system(buildout), end='')
+    Develop: '/sample-buildout/foo' (unchanged)
+    Develop: '/sample-buildout/bar'
+
+    So does removing installed files:
+
+    >>> remove('develop-eggs', 'foo.egg-link')
+    >>> print_(system(buildout), end='')
+    Develop: '/sample-buildout/foo'
+    Develop: '/sample-buildout/bar' (unchanged)
+    >>> ls('develop-eggs')
+    -  bar.egg-link
+    -  foo.egg-link
+    -  zc.recipe.egg.egg-link
+
+    Directories that are no longer developed are uninstalled:
+
+    >>> write('buildout.cfg',
+    ... '''
+    ... [buildout]
+    ... develop = foo
+    ... parts =
+    ... skip-unchanged-develop = true
+    ... ''')
+    >>> print_(system(buildout), end='')
+    Develop: '/sample-buildout/foo' (unchanged)
+    >>> 'bar.egg-link' in os.listdir('develop-eggs')
+    False
+    """
+
+def parallel_develop_installs():
+    r"""
+    With the parallel-develop option, develop directories are installed
+    at the same time:
+
+    >>> for name in 'foo', 'bar':
+    ...     mkdir(name)
+    ...     write(name, name + '.py', '')
+    ...     write(name, 'setup.py',
+    ...           'from setuptools import setup\n'
+    ...           'setup(name=%r, py_modules=[%r])\n' % (name, name))
+    >>> write('buildout.cfg',
+    ... '''
+    ... [buildout]
+    ... develop = foo bar
+    ... parts =
+    ... parallel-develop = 2
+    ... ''')
+    >>> print_(system(buildout), end='')
+    Develop: '/sample-buildout/foo'
+    Develop: '/sample-buildout/bar'
+    >>> ls('develop-eggs')
+    -  bar.egg-link
+    -  foo.egg-link
+    -  zc.recipe.egg.egg-link
+
+    If one of them fails, the others are rolled back:
+
+    >>> write('bar', 'setup.py', 'raise ValueError("broken")')
+    >>> print_(system(buildout), end='') # doctest: +ELLIPSIS
+    Develop: '/sample-buildout/foo'
+    Develop: '/sample-buildout/bar'
+    ...
+    While:
+      Installing.
+      Processing directories listed in the develop option
+      Processing develop directory '/sample-buildout/bar'.
+    ...
+    >>> ls('develop-eggs')
+    -  zc.recipe.egg.egg-link
+    """
+
+def dir_hash_only_reads_changed_files():
+    r"""
+    The digests of develop directories used in recipe signatures can be
+    recorded in a cache, so files are only read again when they change:
+
+    >>> import zc.buildout.buildout
+    >>> from zc.buildout.buildout import _configure_dir_hash, _dir_hash
+    >>> mkdir('src')
+    >>> mkdir('src', 'data')
+    >>> for name in 'a.py', 'b.py', join('data', 'big.bin'):
+    ...     write('src', name, name)
+    ...     os.utime(join('src', name), (0, 0))
+    >>> compute_file_digest = zc.buildout.buildout._compute_file_digest
+    >>> def log_compute_file_digest(path, name):
+    ...     print_('reading', name)
+    ...     return compute_file_digest(path, name)
+    >>> zc.buildout.buildout._compute_file_digest = log_compute_file_digest
+
+    >>> cache = join(sample_buildout, 'dir-hashes.json')
+    >>> _configure_dir_hash(cache)
+    >>> dir_hash = _dir_hash(join(sample_buildout, 'src'))
+    reading a.py
+    reading b.py
+    reading big.bin
+    >>> zc.buildout.buildout._save_dir_hash_cache()
+
+    In a new process, only changed files are read:
+
+    >>> _configure_dir_hash(cache)
+    >>> _dir_hash(join(sample_buildout, 'src')) == dir_hash
+    True
+    >>> write('src', 'b.py', 'changed')
+    >>> _configure_dir_hash(cache)
+    >>> _dir_hash(join(sample_buildout, 'src')) == dir_hash
+    reading b.py
+    False
+
+    Files and directories can be ignored with glob patterns:
+
+    >>> _configure_dir_hash(cache, ['data', '*.log'])
+    >>> write('src', 'debug.log', 'noise')
+    >>> ignoring = _dir_hash(join(sample_buildout, 'src'))
+    reading b.py
+    >>> write('src', 'debug.log', 'more noise')
+    >>> write('src', 'data', 'big.bin', 'changed')
+    >>> _configure_dir_hash(cache, ['data', '*.log'])
+    >>> _dir_hash(join(sample_buildout, 'src')) == ignoring
+    reading b.py
+    True
+
+    >>> zc.buildout.buildout._compute_file_digest = compute_file_digest
+    >>> _configure_dir_hash()
+    """
+
+def part_signatures_resolve_each_recipe_once():
+    """
+    Recipe requirements used by several parts are only resolved once
+    when computing part signatures:
+
+    >>> write('buildout.cfg',
+    ... '''
+    ... [buildout]
+    ... parts = a b c
+    ...
+    ... [a]
+    ... recipe = zc.recipe.egg
+    ... eggs = zc.recipe.egg
+    ...
+    ... [b]
+    ... recipe = zc.recipe.egg:scripts
+    ... eggs = zc.recipe.egg
+    ...
+    ... [c]
+    ... recipe = zc.recipe.egg
+    ... eggs = zc.recipe.egg
+    ... ''')
+    >>> buildout = zc.buildout.buildout.Buildout('buildout.cfg', [])
+    >>> parts = ['a', 'b', 'c']
+    >>> for part in parts:
+    ...     _ = buildout[part]
+    >>> resolve = pkg_resources.working_set.resolve
+    >>> def log_resolve(requirements, *args, **kw):
+    ...     print_('resolving', requirements)
+    ...     return resolve(requirements, *args, **kw)
+    >>> pkg_resources.working_set.resolve = log_resolve
+    >>> buildout._compute_part_signatures(parts)
+    resolving [Requirement.parse('zc.recipe.egg')]
+    >>> del pkg_resources.working_set.resolve
+    >>> len(set(buildout[part]['__buildout_signature__'] for part in parts))
+    1
+    """
+
+def lazy_recipes_are_only_constructed_when_needed():
+    r"""
+    With the lazy-recipes option, recipes are only constructed for parts
+    that must be installed, or whose options are used by other sections:
+
+    >>> mkdir('recipe')
+    >>> write('recipe', 'recipe.py',
+    ... '''
+    ... import os
+    ... class Recipe:
+    ...     def __init__(self, buildout, name, options):
+    ...         print('Loading recipe for %s' % name)
+    ...         self.options = options
+    ...         options['path'] = os.path.join(
+    ...             buildout['buildout']['parts-directory'], name)
+    ...     def install(self):
+    ...         open(self.options['path'], 'w').close()
+    ...         return self.options['path']
+    ...     def update(self):
+    ...         print('Updating %s' % self.options['path'])
+    ... ''')
+    >>> write('recipe', 'setup.py',
+    ... '''
+    ... from setuptools import setup
+    ... setup(name='recipe', py_modules=['recipe'],
+    ...       entry_points={'zc.buildout': ['default = recipe:Recipe']})
+    ... ''')
+    >>> write('buildout.cfg',
+    ... '''
+    ... [buildout]
+    ... develop = recipe
+    ... parts = a b
+    ... lazy-recipes = true
+    ...
+    ... [a]
+    ... recipe = recipe
+    ...
+    ... [b]
+    ... recipe = recipe
+    ... ''')
+    >>> print_(system(buildout), end='')
+    Develop: '/sample-buildout/recipe'
+    Loading recipe for a
+    Loading recipe for b
+    Installing a.
+    Installing b.
+
+    Unchanged parts are left alone, without constructing their recipes:
+
+    >>> print_(system(buildout), end='')
+    Develop: '/sample-buildout/recipe'
+
+    Changed parts, and parts whose installed files are missing, are
+    installed again:
+
+    >>> write('buildout.cfg',
+    ... '''
+    ... [buildout]
+    ... develop = recipe
+    ... parts = a b
+    ... lazy-recipes = true
+    ...
+    ... [a]
+    ... recipe = recipe
+    ...
+    ... [b]
+    ... recipe = recipe
+    ... x = ${a:recipe}
+    ... ''')
+    >>> print_(system(buildout), end='')
+    Develop: '/sample-buildout/recipe'
+    Uninstalling b.
+    Loading recipe for b
+    Installing b.
+    Section `b` contains unused option(s): 'x'.
+    This may be an indication for either a typo in the option's name or a bug in the used recipe.
+
+    Unused options of unchanged parts are still reported:
+
+    >>> print_(system(buildout), end='')
+    Develop: '/sample-buildout/recipe'
+    Section `b` contains unused option(s): 'x'.
+    This may be an indication for either a typo in the option's name or a bug in the used recipe.
+    >>> remove('parts', 'a')
+    >>> print_(system(buildout), end='')
+    Develop: '/sample-buildout/recipe'
+    Uninstalling a.
+    Loading recipe for a
+    Installing a.
+    Section `b` contains unused option(s): 'x'.
+    This may be an indication for either a typo in the option's name or a bug in the used recipe.
+
+    Using an option provided by a recipe constructs it.  The part is then
+    updated as usual:
+
+    >>> write('buildout.cfg',
+    ... '''
+    ... [buildout]
+    ... develop = recipe
+    ... parts = a b
+    ... lazy-recipes = true
+    ...
+    ... [a]
+    ... recipe = recipe
+    ...
+    ... [b]
+    ... recipe = recipe
+    ... x = ${a:path}
+    ... ''')
+    >>> print_(system(buildout), end='')
+    Develop: '/sample-buildout/recipe'
+    Loading recipe for a
+    Uninstalling b.
+    Loading recipe for b
+    Updating a.
+    Updating /sample-buildout/parts/a
+    Installing b.
+    Section `b` contains unused option(s): 'x'.
+    This may be an indication for either a typo in the option's name or a bug in the used recipe.
+    >>> print_(system(buildout), end='')
+    Develop: '/sample-buildout/recipe'
+    Loading recipe for a
+    Updating a.
+    Updating /sample-buildout/parts/a
+    Section `b` contains unused option(s): 'x'.
+    This may be an indication for either a typo in the option's name or a bug in the used recipe.
+    """
+
+
+def verify_installed_files_in_bulk():
+    r"""
+    By default, buildout checks that each installed file of an unchanged
+    part exists.  With verify-installed-files set to scandir, directories
+    containing several installed files are listed instead, using up to
+    verify-workers threads:
+
+    >>> mkdir('recipe')
+    >>> write('recipe', 'recipe.py',
+    ... '''
+    ... import os
+    ... class Recipe:
+    ...     def __init__(self, buildout, name, options):
+    ...         self.paths = [
+    ...             os.path.join(buildout['buildout']['parts-directory'],
+    ...                          name + '-' + str(i))
+    ...             for i in range(3)]
+    ...     def install(self):
+    ...         for path in self.paths:
+    ...             open(path, 'w').close()
+    ...         return self.paths
+    ...     def update(self):
+    ...         pass
+    ... ''')
+    >>> write('recipe', 'setup.py',
+    ... '''
+    ... from setuptools import setup
+    ... setup(name='recipe', py_modules=['recipe'],
+    ...       entry_points={'zc.buildout': ['default = recipe:Recipe']})
+    ... ''')
+    >>> write('buildout.cfg',
+    ... '''
+    ... [buildout]
+    ... develop = recipe
+    ... parts = a
+    ... verify-installed-files = scandir
+    ... verify-workers = 2
+    ...
+    ... [a]
+    ... recipe = recipe
+    ... ''')
+    >>> print_(system(buildout), end='')
+    Develop: '/sample-buildout/recipe'
+    Installing a.
+    >>> print_(system(buildout), end='')
+    Develop: '/sample-buildout/recipe'
+    Updating a.
+    >>> remove('parts', 'a-1')
+    >>> print_(system(buildout), end='')
+    Develop: '/sample-buildout/recipe'
+    Uninstalling a.
+    Installing a.
+
+    With verify-installed-files set to manifest, buildout also records a
+    digest of the directories containing the installed files, and trusts
+    it instead of checking the files, if the directories didn't change:
+
+    >>> write('buildout.cfg',
+    ... '''
+    ... [buildout]
+    ... develop = recipe
+    ... parts = a
+    ... verify-installed-files = manifest
+    ...
+    ... [a]
+    ... recipe = recipe
+    ... ''')
+    >>> import time
+    >>> old = time.time() - 10
+    >>> os.utime('parts', (old, old))
+    >>> print_(system(buildout), end='')
+    Develop: '/sample-buildout/recipe'
+    Updating a.
+    >>> print_(system('grep manifest .installed.cfg'), end='')
+    __buildout_manifest__ = ...
+    >>> print_(system(buildout), end='')
+    Develop: '/sample-buildout/recipe'
+    Updating a.
+
+    Removing a file changes its directory, so the files are checked:
+
+    >>> remove('parts', 'a-1')
+    >>> print_(system(buildout), end='')
+    Develop: '/sample-buildout/recipe'
+    Uninstalling a.
+    Installing a.
+
+    Other values are errors:
+
+    >>> write('buildout.cfg',
+    ... '''
+    ... [buildout]
+    ... parts =
+    ... verify-installed-files = maybe
+    ... ''')
+    >>> print_(system(buildout), end='')
+    While:
+      Installing.
+    Error: Invalid value for verify-installed-files option: maybe
+    """
+
+
+def installed_journal():
+    r"""
+    With installed-format set to journal, the installed database is a
+    journal of JSON records.  Changes are appended to it, rather than
+    writing the whole database each time:
+
+    >>> mkdir('recipe')
+    >>> write('recipe', 'recipe.py',
+    ... '''
+    ... import os
+    ... class Recipe:
+    ...     def __init__(self, buildout, name, options):
+    ...         self.options = options
+    ...         options['path'] = os.path.join(
+    ...             buildout['buildout']['parts-directory'], name)
+    ...     def install(self):
+    ...         open(self.options['path'], 'w').close()
+    ...         return self.options['path']
+    ...     def update(self):
+    ...         pass
+    ... ''')
+    >>> write('recipe', 'setup.py',
+    ... '''
+    ... from setuptools import setup
+    ... setup(name='recipe', py_modules=['recipe'],
+    ...       entry_points={'zc.buildout': ['default = recipe:Recipe']})
+    ... ''')
+    >>> write('buildout.cfg',
+    ... '''
+    ... [buildout]
+    ... develop = recipe
+    ... parts = a b
+    ... installed-format = journal
+    ...
+    ... [a]
+    ... recipe = recipe
+    ...
+    ... [b]
+    ... recipe = recipe
+    ... ''')
+    >>> print_(system(buildout), end='')
+    Develop: '/sample-buildout/recipe'
+    Installing a.
+    Installing b.
+
+    >>> import json
+    >>> def records():
+    ...     with open('.installed.cfg') as f:
+    ...         print_(f.readline(), end='')
+    ...         for line in f:
+    ...             record = json.loads(line)
+    ...             if record[0] == 'update':
+    ...                 print_('update', *sorted(record[1]))
+    ...             else:
+    ...                 print_('section', record[1], *sorted(record[2]))
+    >>> records()
+    ["zc.buildout installed journal", 1]
+    section buildout installed_develop_eggs parts
+    section a __buildout_installed__ __buildout_signature__ path recipe
+    section buildout installed_develop_eggs parts
+    section b __buildout_installed__ __buildout_signature__ path recipe
+
+    >>> print_(system(buildout), end='')
+    Develop: '/sample-buildout/recipe'
+    Updating a.
+    Updating b.
+    >>> records()
+    ["zc.buildout installed journal", 1]
+    section buildout installed_develop_eggs parts
+    section a __buildout_installed__ __buildout_signature__ path recipe
+    section buildout installed_develop_eggs parts
+    section b __buildout_installed__ __buildout_signature__ path recipe
+    update installed_develop_eggs
+    update parts
+    update parts
+
+    A record that wasn't completely written, because buildout was
+    interrupted, is ignored, and the journal is written again:
+
+    >>> with open('.installed.cfg', 'a') as f:
+    ...     _ = f.write('["section", "c", {"recipe": ')
+    >>> print_(system(buildout), end='')
+    Develop: '/sample-buildout/recipe'
+    Updating a.
+    Updating b.
+    >>> records()
+    ["zc.buildout installed journal", 1]
+    section buildout installed_develop_eggs parts
+    section a __buildout_installed__ __buildout_signature__ path recipe
+    section b __buildout_installed__ __buildout_signature__ path recipe
+    update installed_develop_eggs
+    update parts
+    update parts
+
+    Changing the format converts the installed database:
+
+    >>> write('buildout.cfg',
+    ... '''
+    ... [buildout]
+    ... develop = recipe
+    ... parts = a b
+    ...
+    ... [a]
+    ... recipe = recipe
+    ...
+    ... [b]
+    ... recipe = recipe
+    ... ''')
+    >>> print_(system(buildout), end='')
+    Develop: '/sample-buildout/recipe'
+    Updating a.
+    Updating b.
+    >>> print_(system('head -n 1 .installed.cfg'), end='')
+    [buildout]
+    """
+
+
+def profile_option():
+    r"""
+    The --profile option records how long each phase of a run and each
+    part took, prints a summary and saves a trace in the Chrome trace
+    event format:
+
+    >>> mkdir('recipe')
+    >>> write('recipe', 'recipe.py',
+    ... '''
+    ... class Recipe:
+    ...     def __init__(self, buildout, name, options):
+    ...         pass
+    ...     def install(self):
+    ...         return ()
+    ...     update = install
+    ... ''')
+    >>> write('recipe', 'setup.py',
+    ... '''
+    ... from setuptools import setup
+    ... setup(name='recipe', py_modules=['recipe'],
+    ...       entry_points={'zc.buildout': ['default = recipe:Recipe']})
+    ... ''')
+    >>> write('buildout.cfg',
+    ... '''
+    ... [buildout]
+    ... develop = recipe
+    ... parts = a
+    ...
+    ... [a]
+    ... recipe = recipe
+    ... ''')
+    >>> print_(system(buildout + ' --profile'), end='')
+    Develop: '/sample-buildout/recipe'
+    Installing a.
+    Profile:
+          Wall        CPU  Phase or part
+    ...
+
+    >>> import json
+    >>> with open('buildout-profile.json') as f:
+    ...     trace = json.load(f)
+    >>> for event in sorted(trace['traceEvents'],
+    ...                     key=lambda e: (e['cat'], e['name'])):
+    ...     print_(event['cat'], event['name'], event['ph'],
+    ...            event['dur'] >= 0, event['args']['cpu'] >= 0)
+    command Install X True True
+    part Install a X True True
+    phase Checking for upgrades X True True
+    phase Computing signatures X True True
+    phase Developing X True True
+    phase Loading configuration X True True
+
+    A trace file can be given:
+
+    >>> write('buildout.cfg',
+    ... '''
+    ... [buildout]
+    ... develop = recipe
+    ... parts =
+    ... ''')
+    >>> output = system(buildout + ' --profile=trace.json')
+    >>> print_(output[:output.index('Profile:')], end='')
+    Develop: '/sample-buildout/recipe'
+    Uninstalling a.
+    >>> with open('trace.json') as f:
+    ...     trace = json.load(f)
+    >>> sorted(event['name'] for event in trace['traceEvents']
+    ...        if event['cat'] == 'part')
+    ['Uninstalling a']
+    """
+
+
+def profile_recipes_option():
+    r"""
+    With the profile-recipes option, loading each part's recipe, and
+    calling its install or update method, is profiled with cProfile:
+
+    >>> mkdir('recipe')
+    >>> write('recipe', 'recipe.py',
+    ... '''
+    ... class Recipe:
+    ...     def __init__(self, buildout, name, options):
+    ...         pass
+    ...     def install(self):
+    ...         return ()
+    ...     def update(self):
+    ...         pass
+    ... ''')
+    >>> write('recipe', 'setup.py',
+    ... '''
+    ... from setuptools import setup
+    ... setup(name='recipe', py_modules=['recipe'],
+    ...       entry_points={'zc.buildout': ['default = recipe:Recipe']})
+    ... ''')
+    >>> write('buildout.cfg',
+    ... '''
+    ... [buildout]
+    ... develop = recipe
+    ... parts = a
+    ... profile-recipes = true
+    ...
+    ... [a]
+    ... recipe = recipe
+    ... ''')
+    >>> print_(system(buildout), end='')
+    Develop: '/sample-buildout/recipe'
+    Installing a.
+    >>> ls('profiles')
+    -  a.install.pstats
+    -  a.load.pstats
+
+    The profiles can be read with the pstats module:
+
+    >>> import pstats
+    >>> stats = pstats.Stats(join('profiles', 'a.install.pstats'))
+    >>> [func for (filename, line, func) in stats.stats
+    ...  if filename.endswith('recipe.py')]
+    ['install']
+
+    The profiles can be saved in another directory:
+
+    >>> write('buildout.cfg',
+    ... '''
+    ... [buildout]
+    ... develop = recipe
+    ... parts = a
+    ... profile-recipes = true
+    ... profile-recipes-directory = recipe-profiles
+    ...
+    ... [a]
+    ... recipe = recipe
+    ... ''')
+    >>> print_(system(buildout), end='')
+    Develop: '/sample-buildout/recipe'
+    Updating a.
+    >>> ls('recipe-profiles')
+    -  a.load.pstats
+    -  a.update.pstats
+
+    Characters of part names that aren't safe in file names are replaced:
+
+    >>> write('buildout.cfg',
+    ... '''
+    ... [buildout]
+    ... develop = recipe
+    ... parts = a/b
+    ... profile-recipes = true
+    ...
+    ... [a/b]
+    ... recipe = recipe
+    ... ''')
+    >>> print_(system(buildout), end='')
+    Develop: '/sample-buildout/recipe'
+    Uninstalling a.
+    Installing a/b.
+    >>> ls('profiles')
+    -  a.install.pstats
+    -  a.load.pstats
+    -  a_b.install.pstats
+    -  a_b.load.pstats
+
+    If a profile can't be saved, that's logged, and the part is installed
+    anyway:
+
+    >>> write('buildout.cfg',
+    ... '''
+    ... [buildout]
+    ... develop = recipe
+    ... parts = a
+    ... profile-recipes = true
+    ... profile-recipes-directory = not-a-directory
+    ...
+    ... [a]
+    ... recipe = recipe
+    ... ''')
+    >>> write('not-a-directory', '')
+    >>> print_(system(buildout), end='') # doctest: +ELLIPSIS
+    Develop: '/sample-buildout/recipe'
+    Couldn't save the profile of a.load: ...
+    Uninstalling a/b.
+    Installing a.
+    Couldn't save the profile of a.install: ...
+    """
+
+
+def cache_max_size_options():
+    r"""
+    The download-cache-max-size and extends-cache-max-size options limit
+    the size of the caches.  After installing, the least recently used files
+    are removed from the caches until they are small enough:
+
+    >>> mkdir('cache')
+    >>> mkdir('extends-cache')
+    >>> for i, name in enumerate('abc'):
+    ...     write('cache', name, name * 1024)
+    ...     os.utime(join('cache', name), (i, i))
+    >>> write('extends-cache', 'base.cfg', '[buildout]\n')
+    >>> write('buildout.cfg',
+    ... '''
+    ... [buildout]
+    ... parts =
+    ... download-cache = cache
+    ... download-cache-max-size = 2K
+    ... extends-cache = extends-cache
+    ... extends-cache-max-size = 1M
+    ... ''')
+    >>> print_(system(buildout), end='')
+    Removed 1 least recently used files from /sample-buildout/cache.
+    >>> ls('cache')
+    -  b
+    -  c
+    d  dist
+    >>> ls('extends-cache')
+    -  base.cfg
+
+    The cache-prune command does the same without installing anything:
+
+    >>> write('cache', 'd', 'd' * 1024)
+    >>> print_(system(buildout + ' cache-prune'), end='')
+    Removed 1 least recently used files from /sample-buildout/cache.
+    >>> ls('cache')
+    -  c
+    -  d
+    d  dist
+
+    It requires a maximum size:
+
+    >>> write('buildout.cfg',
+    ... '''
+    ... [buildout]
+    ... parts =
+    ... download-cache = cache
+    ... ''')
+    >>> print_(system(buildout + ' cache-prune'), end='')
+    Error: The cache-prune command requires a download-cache and a
+    download-cache-max-size option, or an extends-cache and an
+    extends-cache-max-size option.
+
+    Sizes are numbers of bytes, optionally with a K, M, G or T suffix:
+
+    >>> write('buildout.cfg',
+    ... '''
+    ... [buildout]
+    ... parts =
+    ... download-cache = cache
+    ... download-cache-max-size = lots
+    ... ''')
+    >>> print_(system(buildout + ' cache-prune'), end='')
+    While:
+      Initializing.
+    Error: Invalid value for 'download-cache-max-size' option: 'lots'
+    """
+
+
+def recipe_changes_are_noticed_when_skipping_unchanged_runs():
+    r"""
+    With skip-unchanged-run, changes to the distributions recipes come
+    from are noticed, even if they aren't develop directories of this
+    buildout:
+
+    >>> mkdir('recipe')
+    >>> write('recipe', 'recipe.py',
+    ... '''
+    ... class Recipe:
+    ...     def __init__(self, buildout, name, options):
+    ...         print('Loading recipe for %s' % name)
+    ...     def install(self):
+    ...         return ()
+    ...     update = install
+    ... ''')
+    >>> write('recipe', 'setup.py',
+    ... '''
+    ... from setuptools import setup
+    ... setup(name='recipe', py_modules=['recipe'],
+    ...       entry_points={'zc.buildout': ['default = recipe:Recipe']})
+    ... ''')
+    >>> write('buildout.cfg',
+    ... '''
+    ... [buildout]
+    ... develop = recipe
+    ... parts =
+    ... ''')
+    >>> print_(system(buildout), end='')
+    Develop: '/sample-buildout/recipe'
+    >>> with open(join('develop-eggs', 'recipe.egg-link')) as f:
+    ...     egg_link = f.read()
+    >>> write('buildout.cfg',
+    ... '''
+    ... [buildout]
+    ... parts =
+    ... ''')
+    >>> print_(system(buildout), end='')
+
+    Now the recipe is developed elsewhere, by another buildout say:
+
+    >>> write('develop-eggs', 'recipe.egg-link', egg_link)
+    >>> write('buildout.cfg',
+    ... '''
+    ... [buildout]
+    ... parts = a
+    ... newest = false
+    ... skip-unchanged-run = true
+    ...
+    ... [a]
+    ... recipe = recipe
+    ... ''')
+    >>> print_(system(buildout), end='')
+    Loading recipe for a
+    Installing a.
+    >>> print_(system(buildout), end='')
+    Nothing changed since the last run.
+
+    Changing the recipe causes a full run:
+
+    >>> with open(join('recipe', 'recipe.py')) as f:
+    ...     source = f.read()
+    >>> write('recipe', 'recipe.py', source.replace('Loading', 'Loading the'))
+    >>> print_(system(buildout), end='')
+    Loading the recipe for a
+    Uninstalling a.
+    Installing a.
+    >>> print_(system(buildout), end='')
+    Nothing changed since the last run.
+    """
+
+
 def test_constrained_requirement():
     """
     zc.buildout.easy_install._constrained_requirement(constraint, requirement)
@@ -0,0 +1,251 @@
+##############################################################################
+#
+# Copyright Zope Foundation and Contributors.
+# All Rights Reserved.
+#
+# This software is subject to the provisions of the Zope Public License,
+# Version 2.1 (ZPL).  A copy of the ZPL should accompany this distribution.
+# THIS SOFTWARE IS PROVIDED "AS IS" AND ANY AND ALL EXPRESS OR IMPLIED
+# WARRANTIES ARE DISCLAIMED, INCLUDING, BUT NOT LIMITED TO, THE IMPLIED
+# WARRANTIES OF TITLE, MERCHANTABILITY, AGAINST INFRINGEMENT, AND FITNESS
+# FOR A PARTICULAR PURPOSE.
+#
+##############################################################################
+"""Check that the configuration parser reads files like it used to.
+
+zc.buildout.configparser.parse used to read files line by line with
+readline, and build option values by string concatenation.  The original
+parser is kept here, to compare the two on generated configurations.
+"""
+from io import StringIO
+from zc.buildout.configparser import InvalidMarker
+from zc.buildout.configparser import Marker
+from zc.buildout.configparser import MissingSectionHeaderError
+from zc.buildout.configparser import ParsingError
+from zc.buildout.configparser import logger
+from zc.buildout.configparser import option_start
+from zc.buildout.configparser import section_header
+
+import random
+import re
+import textwrap
+import unittest
+import zc.buildout.configparser
+
+
+leading_blank_lines = re.compile(r"^(\s*\n)+")
+
+
+def readline_parse(fp, fpname, exp_globals=dict):
+    """The configuration parser of zc.buildout 5.1, unchanged."""
+    sections = {}
+    # the current section condition, possibly updated from a section expression
+    section_condition = True
+    context = None
+    cursect = None                            # None, or a dictionary
+    blockmode = None
+    optname = None
+    lineno = 0
+    e = None                                  # None, or an exception
+    while True:
+        line = fp.readline()
+        if not line:
+            break # EOF
+
+        lineno = lineno + 1
+
+        if line[0] in '#;':
+            continue # comment
+
+        if line[0].isspace() and cursect is not None and optname:
+            if not section_condition:
+                #skip section based on its expression condition
+                continue
+            # continuation line
+            if blockmode:
+                line = line.rstrip()
+            else:
+                line = line.strip()
+                if not line:
+                    continue
+            cursect[optname] = "%s\n%s" % (cursect[optname], line)
+        else:
+            header = section_header(line)
+            if header:
+                # reset to True when starting a new section
+                section_condition = True
+                sectname = header.group('name')
+
+                head = header.group('head') # the starting [
+                expression = header.group('expression')
+                tail = header.group('tail') # closing ]and comment
+                if expression:
+                    # normalize tail comments to Python style
+                    tail = tail.replace(';', '#') if tail else ''
+                    # un-escape literal # and ; . Do not use a
+                    # string-escape decode
+                    expr = expression.replace(r'\x23','#').replace(r'\x3b', ';')
+                    try:
+                        # new-style markers as used in pip constraints, e.g.:
+                        # 'python_version < "3.11" and platform_system == "Windows"'
+                        marker = Marker(expr)
+                        section_condition = marker.evaluate()
+                    except InvalidMarker:
+                        # old style buildout expression
+                        # rebuild a valid Python expression wrapped in a list
+                        expr = head + expr + tail
+                        # lazily populate context only expression
+                        if not context:
+                            context = exp_globals()
+                        # evaluated expression is in list: get first element
+                        section_condition = eval(expr, context)[0]
+                    # finally, ignore section when an expression
+                    # evaluates to false
+                    if not section_condition:
+                        logger.debug(
+                            'Ignoring section %(sectname)r with [expression]:'
+                            ' %(expression)r' % locals())
+                        continue
+
+                if sectname in sections:
+                    cursect = sections[sectname]
+                else:
+                    sections[sectname] = cursect = {}
+                # So sections can't start with a continuation line
+                optname = None
+            elif cursect is None:
+                if not line.strip():
+                    continue
+                # no section header in the file?
+                raise MissingSectionHeaderError(fpname, lineno, line)
+            else:
+                if line[:2] == '=>':
+                    line = '<part-dependencies> = ' + line[2:]
+                mo = option_start(line)
+                if mo:
+                    if not section_condition:
+                        # filter out options of conditionally ignored section
+                        continue
+                    # option start line
+                    optname, optval = mo.group('name', 'value')
+                    optname = optname.rstrip()
+                    optval = optval.strip()
+                    # Handle multiple extensions of the same value in the
+                    # same file. This happens with conditional sections.
+                    opt_op = optname[-1]
+                    if opt_op not in '+-':
+                        opt_op = '='
+                    if optname in cursect and opt_op in '+-':
+                        # Strip any trailing \n, which happens when we have multiple
+                        # +=/-= in one file
+                        cursect[optname] = cursect[optname].rstrip()
+                        if optval:
+                            cursect[optname] = "%s\n%s" % (cursect[optname], optval)
+                    else:
+                        # If an assignment (=) comes after an extend (+=) /
+                        # remove (-=), it overrides and replaces the preceding
+                        # extend / remove
+                        if opt_op == '=':
+                            for suffix in '+-':
+                                tempname = "%s %s" % (optname, suffix)
+                                if tempname in cursect:
+                                    del cursect[tempname]
+                        cursect[optname] = optval
+                    blockmode = not optval
+                elif not (optname or line.strip()):
+                    # blank line after section start
+                    continue
+                else:
+                    # a non-fatal parsing error occurred.  set up the
+                    # exception but keep going. the exception will be
+                    # raised at the end of the file and will contain a
+                    # list of all bogus lines
+                    if not e:
+                        e = ParsingError(fpname)
+                    e.append(lineno, repr(line))
+
+    # if any parsing errors occurred, raise an exception
+    if e:
+        raise e
+
+    for sectname in sections:
+        section = sections[sectname]
+        for name in section:
+            value = section[name]
+            if value[:1].isspace():
+                section[name] = leading_blank_lines.sub(
+                    '', textwrap.dedent(value.rstrip()))
+
+    return sections
+
+
+# Pieces configurations are generated from, chosen to exercise the
+# corners of the syntax: comments, continuation lines and their
+# indentation, blank lines, operators, conditions and errors.
+_names = ['a', 'b', 'parts', 'x-y', 'eggs']
+_headers = [
+    '[{name}]', '[ {name} ]', '[{name}] # comment', '[{name}]; comment',
+    '[{name}: True]', '[{name}: False]', '[{name}:1 == 2]',
+    '[{name}: python_version > "2"]', '[{name}: python_version < "2"]',
+    ]
+_options = [
+    '{name} = {value}', '{name}={value}', '{name} += {value}',
+    '{name} -= {value}', '{name} =', '{name} =   ', '=> {value}',
+    '{name}+={value}', '{name} + = {value}', '{name}:x = {value}',
+    ]
+_values = ['1', 'a b', ' spaced ', '${buildout:x}', '# not a comment', '']
+_others = [
+    '', ' ', '\t', '# comment', '; comment', '  continued',
+    '\tcontinued', '      deeply continued  ', '    ', ' # indented',
+    ' \tmixed', '\t  mixed', '  a = b', '  x\ry', '\x0c',
+    ]
+_errors = ['bogus', '[not a header', '[]', 'x y = z', '{name}: {value}']
+
+
+def _generate(rng):
+    lines = []
+    for _ in range(rng.randrange(1, 30)):
+        kind = rng.random()
+        name = rng.choice(_names)
+        if kind < 0.01:
+            line = rng.choice(_errors)
+        elif kind < 0.15:
+            line = rng.choice(_headers)
+        elif kind < 0.5:
+            line = rng.choice(_options)
+        else:
+            line = rng.choice(_others)
+        lines.append(line.format(name=name, value=rng.choice(_values)))
+    if rng.random() < 0.95:
+        # Most configurations start with a section.
+        lines.insert(0, '[%s]' % rng.choice(_names))
+    text = '\n'.join(lines)
+    if rng.random() < 0.7:
+        text += '\n'
+    return text
+
+
+def _outcome(parse, text):
+    try:
+        return parse(StringIO(text), 'test.cfg')
+    except Exception as e:
+        return type(e).__name__, str(e)
+
+
+class TestConformance(unittest.TestCase):
+    """The parser gives the same results and errors as readline_parse."""
+
+    def test_examples(self):
+        for text in ['', '\n', '[s]', '[s]\na = 1', '[s]\na =\n  1\n\n  2',
+                     'a = 1\n', '[s]\n  x\n', '[s]\na = 1\r\n  2\r\n',
+                     '[s]\na =\n\n  \n    1\n  2\n\n', '[s]\na + = 1',
+                     '[s]\na =\n\t1\n  2', '[s]\na += \n  1\na +=\n  2\n']:
+            self.assertEqual(_outcome(zc.buildout.configparser.parse, text),
+                             _outcome(readline_parse, text), text)
+
+    def test_generated(self):
+        rng = random.Random(42)
+        for _ in range(5000):
+            text = _generate(rng)
+            self.assertEqual(_outcome(zc.buildout.configparser.parse, text),
+                             _outcome(readline_parse, text), text)
@@ -1,8 +1,10 @@
+from contextlib import contextmanager
 from importlib.metadata import version
 
 import packaging.version
 import re
 import os
+import tempfile
 
 
 # In some cases we need to check the setuptools version to know what we can do.
@@ -23,6 +25,23 @@ def normalize_name(name):
     return re.sub(r"[-_.]+", "-", name).lower().replace('-', '_')
 
 
+@contextmanager
+def atomic_write(path):
+    """Open a file to write, that replaces path once it's written.
+
+    The file is created in the same directory, so readers see either the
+    old or the new content.  If writing fails, it's removed.
+    """
+    fd, tmp = tempfile.mkstemp(dir=os.path.dirname(path))
+    try:
+        with os.fdopen(fd, 'w') as f:
+            yield f
+        os.replace(tmp, path)
+    except Exception:
+        os.remove(tmp)
+        raise
+
+
 def get_pth_paths(loc):
     """Scan directory for .pth files and return referenced paths."""
     paths = []